@@ -1,61 +1,74 @@
-import json
 import logging
-from typing import Dict, List
+from functools import lru_cache
+from typing import Dict, List, Optional
 
+import msgspec
+import orjson
 from langchain_google_genai import ChatGoogleGenerativeAI
 
-from config import GOOGLE_API_KEY, GEMINI_JUDGE_MODEL, JUDGE_TEMPERATURE
-from agents.prompts import RAG_TRIAD_PROMPT
+from config import (
+    GOOGLE_API_KEY,
+    GEMINI_JUDGE_MODEL,
+    JUDGE_TEMPERATURE,
+    CONTEXT_TOKEN_BUDGET,
+)
+from agents.prompts import RAG_TRIAD_SYSTEM_PROMPT, RAG_TRIAD_USER_PROMPT
+from agents.schemas import EvalResult
+from utils.json_utils import parse_llm_json
+from utils.tokenizer import truncate_tokens
 
 logger = logging.getLogger(__name__)
 
 
-def _parse_llm_json(response) -> any:
-    """Extract and parse JSON from an LLM response, stripping markdown wrappers."""
-    content = response.content.strip()
-    if content.startswith("```json"):
-        content = content.replace("```json", "").replace("```", "").strip()
-    elif content.startswith("```"):
-        content = content.replace("```", "").strip()
-    return json.loads(content)
+@lru_cache(maxsize=1)
+def _get_judge_llm() -> ChatGoogleGenerativeAI:
+    return ChatGoogleGenerativeAI(
+        model=GEMINI_JUDGE_MODEL,
+        google_api_key=GOOGLE_API_KEY,
+        temperature=JUDGE_TEMPERATURE,
+    )
+
+
+def _invoke_judge(user_prompt: str) -> any:
+    response = _get_judge_llm().invoke([("system", RAG_TRIAD_SYSTEM_PROMPT), ("human", user_prompt)])
+    return parse_llm_json(response, List[EvalResult])
 
 
 def evaluate_batch(
     questions: List[Dict],
     context: str,
     topic: str = "the document",
+    context_tokens: Optional[List[int]] = None,
 ) -> List[Dict]:
-    """Evaluate all questions in a single LLM call."""
+    """Evaluate all questions in a single LLM call.
+
+    context_tokens are the already-encoded context, for callers judging several
+    batches against the same context.
+    """
     if not questions:
         return []
 
-    llm = ChatGoogleGenerativeAI(
-        model=GEMINI_JUDGE_MODEL,
-        google_api_key=GOOGLE_API_KEY,
-        temperature=JUDGE_TEMPERATURE,
-    )
-
-    questions_json = json.dumps(questions, indent=2)
-    context_truncated = context[:4000]
+    # Item ids mean nothing to the judge; leave them out of the prompt
+    questions_json = orjson.dumps([{k: v for k, v in q.items() if k != "id"} for q in questions]).decode()
+    context_truncated, n_context_tokens = truncate_tokens(context, CONTEXT_TOKEN_BUDGET, context_tokens)
+    if n_context_tokens > CONTEXT_TOKEN_BUDGET:
+        logger.warning(f"Judge context truncated from {n_context_tokens} to {CONTEXT_TOKEN_BUDGET} tokens")
 
-    prompt = RAG_TRIAD_PROMPT.format(
+    prompt = RAG_TRIAD_USER_PROMPT.format(
         context=context_truncated,
         topic=topic,
         questions_json=questions_json,
     )
 
-    response = llm.invoke(prompt)
-    evaluations = _parse_llm_json(response)
+    evaluations = _invoke_judge(prompt)
 
     if not isinstance(evaluations, list):
         evaluations = [evaluations]
 
     # Pad or trim to match question count
     while len(evaluations) < len(questions):
-        evaluations.append({
-            "quality_score": 0.0,
-            "is_supported": False,
-            "issues": ["evaluation_missing"],
-        })
+        evaluations.append(msgspec.to_builtins(
+            EvalResult(quality_score=0.0, is_supported=False, issues=["evaluation_missing"])
+        ))
 
     return evaluations[:len(questions)]
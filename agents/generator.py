@@ -1,39 +1,57 @@
 import uuid
-import json
+import math
+import asyncio
 import logging
-from typing import Dict, List
+from functools import lru_cache
+from typing import AsyncIterator, Awaitable, Dict, List, Tuple, TypeVar
 
 from langchain_google_genai import ChatGoogleGenerativeAI
 
-from config import GOOGLE_API_KEY, GEMINI_LLM_MODEL, GENERATION_TEMPERATURE
+from config import (
+    GOOGLE_API_KEY,
+    GEMINI_LLM_MODEL,
+    GENERATION_TEMPERATURE,
+    LLM_MAX_CONCURRENCY,
+    QUESTION_CHUNK_GROUPS,
+)
 from agents.prompts import (
     INTENT_PARSER_PROMPT,
-    MCQ_GENERATOR_PROMPT,
-    FILL_BLANK_PROMPT,
-    SUMMARY_PROMPT,
+    MCQ_GENERATOR_SYSTEM_PROMPT,
+    MCQ_GENERATOR_USER_PROMPT,
+    FILL_BLANK_SYSTEM_PROMPT,
+    FILL_BLANK_USER_PROMPT,
+    SUMMARY_SYSTEM_PROMPT,
+    SUMMARY_USER_PROMPT,
 )
+from agents.schemas import MCQ_RESPONSE, FILL_BLANK_RESPONSE, SummaryItem
+from utils.json_utils import parse_llm_json
+from utils.semantic_cache import semantic_cache
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
 
-def _parse_llm_json(response) -> any:
-    """Extract and parse JSON from an LLM response, stripping markdown wrappers."""
-    content = response.content.strip()
-    if content.startswith("```json"):
-        content = content.replace("```json", "").replace("```", "").strip()
-    elif content.startswith("```"):
-        content = content.replace("```", "").strip()
-    return json.loads(content)
+_DIFFICULTIES = {"easy", "medium", "hard", "mixed"}
 
+# (group or section index, position within it). Items are yielded as their LLM
+# call finishes; sorting by this key restores the document order.
+OrderKey = Tuple[int, int]
 
-def _get_llm(temperature=None):
+
+@lru_cache(maxsize=8)
+def _build_llm(temperature: float) -> ChatGoogleGenerativeAI:
+    """One client per temperature, so its HTTP connection pool is reused across calls."""
     return ChatGoogleGenerativeAI(
         model=GEMINI_LLM_MODEL,
         google_api_key=GOOGLE_API_KEY,
-        temperature=temperature if temperature is not None else GENERATION_TEMPERATURE,
+        temperature=temperature,
     )
 
 
+def _get_llm(temperature=None):
+    return _build_llm(temperature if temperature is not None else GENERATION_TEMPERATURE)
+
+
 def _format_context(context_chunks: List[str], context_metadata: List[Dict]) -> str:
     return "\n\n".join(
         f"[Page {meta.get('page', 'unknown')}, Section: {meta.get('section_title', 'unknown')}]\n{text}"
@@ -48,15 +66,20 @@ def _unwrap_list(data, key: str) -> list:
     return data
 
 
-def parse_intent(user_prompt: str) -> Dict:
-    logger.info(f"Parsing intent: '{user_prompt}'")
-
+# Exact repeats only: near-duplicate prompts ("five" vs "ten MCQs", "first law" vs
+# "second law") embed almost identically but must parse to different intents
+@semantic_cache("intent", threshold=1.0)
+def _invoke_intent_parser(user_prompt: str) -> Dict:
     llm = _get_llm(temperature=0.0)
     prompt = INTENT_PARSER_PROMPT.format(user_prompt=user_prompt)
+    return parse_llm_json(llm.invoke(prompt))
+
+
+def parse_intent(user_prompt: str) -> Dict:
+    logger.info(f"Parsing intent: '{user_prompt}'")
 
     try:
-        response = llm.invoke(prompt)
-        intent = _parse_llm_json(response)
+        intent = _invoke_intent_parser(user_prompt)
         logger.info(f"Parsed intent: {intent}")
     except Exception as e:
         logger.error(f"Intent parsing failed: {e}, using fallback")
@@ -70,6 +93,11 @@ def parse_intent(user_prompt: str) -> Dict:
 
     if intent.get("n") is None:
         intent["n"] = 5 if intent.get("topic") else 1
+    try:
+        # The LLM sometimes returns the count as a string ("5")
+        intent["n"] = int(intent["n"])
+    except (TypeError, ValueError):
+        logger.warning(f"Intent count is not an integer: {intent['n']!r}")
     if intent.get("difficulty") is None:
         intent["difficulty"] = "mixed"
 
@@ -77,71 +105,186 @@ def parse_intent(user_prompt: str) -> Dict:
     return intent
 
 
-def generate_mcqs(
+def _messages(system_prompt: str, user_prompt: str) -> List[Tuple[str, str]]:
+    """Static instructions first, per-request data last."""
+    return [("system", system_prompt), ("human", user_prompt)]
+
+
+async def _bounded_ainvoke(llm, messages: List[Tuple[str, str]], semaphore: asyncio.Semaphore):
+    """Run llm.ainvoke while holding the semaphore, capping concurrent requests."""
+    async with semaphore:
+        return await llm.ainvoke(messages)
+
+
+async def _indexed(index: int, awaitable: Awaitable[T]) -> Tuple[int, T]:
+    """Tag a task's result with its index, so as_completed callers know which one finished."""
+    return index, await awaitable
+
+
+def _group_context(
+    context_chunks: List[str],
+    context_metadata: List[Dict],
+    n_groups: int,
+) -> List[Tuple[List[str], List[Dict]]]:
+    """Partition chunks into at most n_groups contiguous groups, keeping sections together."""
+    section_order = {}
+    for meta in context_metadata:
+        section_order.setdefault(meta.get("section_title", "Unknown"), len(section_order))
+    ordered = sorted(
+        zip(context_chunks, context_metadata),
+        key=lambda pair: section_order[pair[1].get("section_title", "Unknown")],
+    )
+
+    group_size = math.ceil(len(ordered) / n_groups)
+    groups = []
+    for i in range(0, len(ordered), group_size):
+        chunks, metas = zip(*ordered[i:i + group_size])
+        groups.append((list(chunks), list(metas)))
+    return groups
+
+
+def in_order(pairs: List[Tuple[OrderKey, Dict]]) -> List[Dict]:
+    """Drop the order keys from (order key, item) pairs, sorted back into document order."""
+    return [item for _, item in sorted(pairs, key=lambda pair: pair[0])]
+
+
+async def _aiter_questions(
+    system_prompt: str,
+    user_template: str,
+    schema,
     context_chunks: List[str],
     context_metadata: List[Dict],
     intent: Dict,
-) -> List[Dict]:
+) -> AsyncIterator[Tuple[OrderKey, Dict]]:
+    """Split the requested questions across chunk groups, generate each group concurrently,
+    and yield (order key, question) as soon as their group's response arrives."""
+    n_groups = max(1, min(QUESTION_CHUNK_GROUPS, len(context_chunks), intent["n"]))
+    groups = _group_context(context_chunks, context_metadata, n_groups)
+    # Every group asks for at least one question (len(groups) <= n) and the quotas sum to n
+    per_group, extra = divmod(intent["n"], len(groups))
+    quotas = [per_group + (i < extra) for i in range(len(groups))]
+
+    llm = _get_llm()
+    semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    prompts = [
+        user_template.format(
+            retrieved_chunks=_format_context(chunks, metas),
+            num_questions=quota,
+            difficulty=intent["difficulty"],
+        )
+        for (chunks, metas), quota in zip(groups, quotas)
+    ]
+    tasks = [
+        asyncio.ensure_future(_indexed(i, _bounded_ainvoke(llm, _messages(system_prompt, prompt), semaphore)))
+        for i, prompt in enumerate(prompts)
+    ]
+
+    try:
+        for next_response in asyncio.as_completed(tasks):
+            group_idx, response = await next_response
+            questions = _unwrap_list(parse_llm_json(response, schema), "questions")
+            for position, q in enumerate(questions[:quotas[group_idx]]):
+                q["id"] = str(uuid.uuid4())
+                # Guard against the model echoing a placeholder instead of a level
+                if q.get("difficulty") not in _DIFFICULTIES:
+                    q["difficulty"] = intent["difficulty"]
+                yield (group_idx, position), q
+    finally:
+        # Stop groups still in flight when the consumer stops early or a group fails
+        for task in tasks:
+            task.cancel()
+
+
+async def aiter_mcqs(
+    context_chunks: List[str],
+    context_metadata: List[Dict],
+    intent: Dict,
+) -> AsyncIterator[Tuple[OrderKey, Dict]]:
     if not context_chunks:
-        return []
+        return
 
     logger.info(f"Generating {intent['n']} MCQs")
+    emitted = 0
+    async for key, q in _aiter_questions(
+        MCQ_GENERATOR_SYSTEM_PROMPT, MCQ_GENERATOR_USER_PROMPT, MCQ_RESPONSE, context_chunks, context_metadata, intent,
+    ):
+        emitted += 1
+        yield key, q
+    logger.info(f"Generated {emitted} MCQs")
 
-    llm = _get_llm()
-    formatted_context = _format_context(context_chunks, context_metadata)
 
-    prompt = MCQ_GENERATOR_PROMPT.format(
-        retrieved_chunks=formatted_context,
-        num_questions=intent["n"],
-        difficulty=intent["difficulty"],
-    )
+async def aiter_fill_blanks(
+    context_chunks: List[str],
+    context_metadata: List[Dict],
+    intent: Dict,
+) -> AsyncIterator[Tuple[OrderKey, Dict]]:
+    if not context_chunks:
+        return
 
-    response = llm.invoke(prompt)
-    questions = _unwrap_list(_parse_llm_json(response), "questions")
-    logger.info(f"Generated {len(questions)} MCQs")
+    logger.info(f"Generating {intent['n']} fill-blank questions")
+    emitted = 0
+    async for key, q in _aiter_questions(
+        FILL_BLANK_SYSTEM_PROMPT, FILL_BLANK_USER_PROMPT, FILL_BLANK_RESPONSE, context_chunks, context_metadata, intent,
+    ):
+        emitted += 1
+        yield key, q
+    logger.info(f"Generated {emitted} fill-blank questions")
 
-    for q in questions:
-        q["id"] = str(uuid.uuid4())
 
-    return questions
+async def agenerate_mcqs(
+    context_chunks: List[str],
+    context_metadata: List[Dict],
+    intent: Dict,
+) -> List[Dict]:
+    return in_order([pair async for pair in aiter_mcqs(context_chunks, context_metadata, intent)])
 
 
-def generate_fill_blanks(
+async def agenerate_fill_blanks(
     context_chunks: List[str],
     context_metadata: List[Dict],
     intent: Dict,
 ) -> List[Dict]:
-    if not context_chunks:
-        return []
+    return in_order([pair async for pair in aiter_fill_blanks(context_chunks, context_metadata, intent)])
 
-    logger.info(f"Generating {intent['n']} fill-blank questions")
 
-    llm = _get_llm()
-    formatted_context = _format_context(context_chunks, context_metadata)
+def generate_mcqs(
+    context_chunks: List[str],
+    context_metadata: List[Dict],
+    intent: Dict,
+) -> List[Dict]:
+    """Sync wrapper around agenerate_mcqs for callers outside an event loop."""
+    return asyncio.run(agenerate_mcqs(context_chunks, context_metadata, intent))
 
-    prompt = FILL_BLANK_PROMPT.format(
-        retrieved_chunks=formatted_context,
-        num_questions=intent["n"],
-        difficulty=intent["difficulty"],
-    )
 
-    response = llm.invoke(prompt)
-    questions = _unwrap_list(_parse_llm_json(response), "questions")
-    logger.info(f"Generated {len(questions)} fill-blank questions")
+def generate_fill_blanks(
+    context_chunks: List[str],
+    context_metadata: List[Dict],
+    intent: Dict,
+) -> List[Dict]:
+    """Sync wrapper around agenerate_fill_blanks for callers outside an event loop."""
+    return asyncio.run(agenerate_fill_blanks(context_chunks, context_metadata, intent))
 
-    for q in questions:
-        q["id"] = str(uuid.uuid4())
 
-    return questions
+async def _astream_summary(llm, user_prompt: str, semaphore: asyncio.Semaphore) -> Dict:
+    """Stream one summary and parse it as soon as its own stream ends, while other sections are still generating."""
+    async with semaphore:
+        response = None
+        async for chunk in llm.astream(_messages(SUMMARY_SYSTEM_PROMPT, user_prompt)):
+            response = chunk if response is None else response + chunk
 
+    summary_obj = parse_llm_json(response, SummaryItem)
+    summary_obj["id"] = str(uuid.uuid4())
+    return summary_obj
 
-def generate_summaries(
+
+async def aiter_summaries(
     context_chunks: List[str],
     context_metadata: List[Dict],
     intent: Dict,
-) -> List[Dict]:
+) -> AsyncIterator[Tuple[OrderKey, Dict]]:
+    """Yield (order key, summary) in the order their streams finish."""
     llm = _get_llm()
-    summaries = []
+    semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
 
     if intent["mode"] == "summary_per_section":
         sections = {}
@@ -149,23 +292,47 @@ def generate_summaries(
             section = meta.get("section_title", "Unknown")
             sections.setdefault(section, []).append(chunk)
 
-        for section, chunks in sections.items():
-            prompt = SUMMARY_PROMPT.format(
+        prompts = [
+            SUMMARY_USER_PROMPT.format(
                 section_text="\n\n".join(chunks),
                 section_title=section,
             )
-            response = llm.invoke(prompt)
-            summary_obj = _parse_llm_json(response)
-            summary_obj["id"] = str(uuid.uuid4())
-            summaries.append(summary_obj)
+            for section, chunks in sections.items()
+        ]
+        logger.info(f"Generating {len(prompts)} section summaries concurrently")
     else:
-        prompt = SUMMARY_PROMPT.format(
-            section_text="\n\n".join(context_chunks),
-            section_title=intent.get("topic", "Document"),
-        )
-        response = llm.invoke(prompt)
-        summary_obj = _parse_llm_json(response)
-        summary_obj["id"] = str(uuid.uuid4())
-        summaries.append(summary_obj)
+        prompts = [
+            SUMMARY_USER_PROMPT.format(
+                section_text="\n\n".join(context_chunks),
+                section_title=intent.get("topic", "Document"),
+            )
+        ]
+
+    tasks = [
+        asyncio.ensure_future(_indexed(i, _astream_summary(llm, prompt, semaphore)))
+        for i, prompt in enumerate(prompts)
+    ]
+    try:
+        for next_summary in asyncio.as_completed(tasks):
+            section_idx, summary = await next_summary
+            yield (section_idx, 0), summary
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def agenerate_summaries(
+    context_chunks: List[str],
+    context_metadata: List[Dict],
+    intent: Dict,
+) -> List[Dict]:
+    return in_order([pair async for pair in aiter_summaries(context_chunks, context_metadata, intent)])
+
 
-    return summaries
+def generate_summaries(
+    context_chunks: List[str],
+    context_metadata: List[Dict],
+    intent: Dict,
+) -> List[Dict]:
+    """Sync wrapper around agenerate_summaries for callers outside an event loop."""
+    return asyncio.run(agenerate_summaries(context_chunks, context_metadata, intent))
@@ -0,0 +1,70 @@
+import time
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, List, Tuple
+
+from config import EVAL_BATCH_SIZE, LLM_MAX_CONCURRENCY
+from agents.evaluation import evaluate_batch
+from agents.generator import OrderKey, in_order
+from utils.tokenizer import encode
+
+logger = logging.getLogger(__name__)
+
+
+class EvaluationError(Exception):
+    """A judge call failed; raised so callers can tell it apart from generation errors."""
+
+
+async def generate_and_evaluate(
+    items: AsyncIterator[Tuple[OrderKey, Dict]],
+    context: str,
+    topic: str = "the document",
+) -> Tuple[List[Dict], int]:
+    """Consume (order key, item) pairs, judging each batch of EVAL_BATCH_SIZE while generation continues.
+
+    Batches are formed in arrival order; each item gets its RAG Triad result under
+    "evaluator". Returns the items sorted by order key (document order, whatever
+    order they finished in) and the time spent generating them, in ms.
+    """
+    semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    # Every batch is judged against the same context, so it is tokenized once,
+    # alongside the first generation calls
+    context_tokens = asyncio.ensure_future(asyncio.to_thread(encode, context))
+
+    async def judge(batch: List[Dict]):
+        async with semaphore:
+            try:
+                evaluations = await asyncio.to_thread(
+                    evaluate_batch,
+                    questions=batch,
+                    context=context,
+                    topic=topic,
+                    context_tokens=await context_tokens,
+                )
+            except Exception as e:
+                raise EvaluationError(str(e)) from e
+        for item, eval_result in zip(batch, evaluations):
+            item["evaluator"] = eval_result
+        logger.info(f"Evaluated batch of {len(batch)} items")
+
+    generation_start = time.perf_counter_ns()
+    items_out, batch, judges = [], [], []
+    try:
+        async for key, item in items:
+            items_out.append((key, item))
+            batch.append(item)
+            if len(batch) == EVAL_BATCH_SIZE:
+                judges.append(asyncio.ensure_future(judge(batch)))
+                batch = []
+        generation_ms = (time.perf_counter_ns() - generation_start) // 1_000_000
+
+        if batch:
+            judges.append(asyncio.ensure_future(judge(batch)))
+        await asyncio.gather(*judges)
+    finally:
+        # Only has an effect when generation or another batch failed
+        context_tokens.cancel()
+        for task in judges:
+            task.cancel()
+
+    return in_order(items_out), generation_ms
@@ -23,10 +23,11 @@ Rules:
 Return ONLY the JSON, no other text."""
 
 
-MCQ_GENERATOR_PROMPT = """You are an educational content generator. Based ONLY on the context below, generate {num_questions} multiple-choice questions.
+# Generation and judge prompts are split into a static system prompt and a
+# per-request user prompt, so every call starts with the same instructions and
+# only the user prompt varies.
 
-CONTEXT FROM TEXTBOOK:
-{retrieved_chunks}
+MCQ_GENERATOR_SYSTEM_PROMPT = """You are an educational content generator. Based ONLY on the context provided by the user, generate multiple-choice questions.
 
 REQUIREMENTS:
 1. Questions must be DIRECTLY answerable from the context (extractive approach)
@@ -36,58 +37,66 @@ REQUIREMENTS:
    - Exactly one correct answer
    - 3 plausible distractors (common misconceptions, not random)
 3. Include 2-sentence explanation citing the context
-4. Difficulty level: {difficulty}
+4. Set each question's "difficulty" to the difficulty level requested by the user (easy, medium, hard, or mixed)
 5. For tables: ask about values, trends, relationships
 6. For equations: ask about solving, identifying variables, or concepts
 
 OUTPUT ONLY VALID JSON (array of question objects):
 [
-  {{
+  {
     "question": "What is the solution to 2x + 4 = 12?",
-    "options": {{
+    "options": {
       "A": "x = 3",
       "B": "x = 4",
       "C": "x = 5",
       "D": "x = 6"
-    }},
+    },
     "correct": "B",
     "explanation": "According to the context, to solve 2x + 4 = 12, subtract 4 from both sides to get 2x = 8, then divide by 2 to get x = 4.",
-    "difficulty": "{difficulty}"
-  }}
+    "difficulty": "medium"
+  }
 ]
 
-Generate exactly {num_questions} questions. Return ONLY the JSON array."""
+Generate exactly the requested number of questions. Return ONLY the JSON array."""
 
 
-FILL_BLANK_PROMPT = """You are an educational content generator. Based ONLY on the context below, generate {num_questions} fill-in-the-blank questions.
+MCQ_GENERATOR_USER_PROMPT = """Number of questions: {num_questions}
+Difficulty level: {difficulty}
 
 CONTEXT FROM TEXTBOOK:
-{retrieved_chunks}
+{retrieved_chunks}"""
+
+
+FILL_BLANK_SYSTEM_PROMPT = """You are an educational content generator. Based ONLY on the context provided by the user, generate fill-in-the-blank questions.
 
 REQUIREMENTS:
 1. Create sentences from the context with ONE key term/number removed
 2. Use ____ to mark the blank
 3. The correct answer must appear verbatim in the context
 4. Include 2-sentence explanation
-5. Difficulty: {difficulty}
+5. Set each question's "difficulty" to the difficulty level requested by the user (easy, medium, hard, or mixed)
 
 OUTPUT ONLY VALID JSON:
 [
-  {{
+  {
     "question": "The quadratic formula is x = ____",
     "correct": "(-b +/- sqrt(b^2-4ac)) / 2a",
     "explanation": "From the context, the quadratic formula solves ax^2 + bx + c = 0 and is given by x = (-b +/- sqrt(b^2-4ac)) / 2a.",
-    "difficulty": "{difficulty}"
-  }}
+    "difficulty": "medium"
+  }
 ]
 
-Generate exactly {num_questions} questions. Return ONLY the JSON array."""
+Generate exactly the requested number of questions. Return ONLY the JSON array."""
 
 
-SUMMARY_PROMPT = """You are an educational content summarizer. Based on the context below, create a concise summary.
+FILL_BLANK_USER_PROMPT = """Number of questions: {num_questions}
+Difficulty: {difficulty}
 
-CONTEXT:
-{section_text}
+CONTEXT FROM TEXTBOOK:
+{retrieved_chunks}"""
+
+
+SUMMARY_SYSTEM_PROMPT = """You are an educational content summarizer. Based on the context provided by the user, create a concise summary.
 
 REQUIREMENTS:
 1. 3-5 sentences covering main concepts
@@ -95,24 +104,23 @@ REQUIREMENTS:
 3. Clear and student-friendly language
 
 OUTPUT ONLY VALID JSON:
-{{
+{
   "summary": "...",
-  "section": "{section_title}"
-}}"""
+  "section": "<section title given by the user>"
+}"""
 
 
-RAG_TRIAD_PROMPT = """You are an educational content quality evaluator. Assess each generated question using the RAG Triad framework.
+SUMMARY_USER_PROMPT = """Section title: {section_title}
 
-RETRIEVED CONTEXT:
-{context}
+CONTEXT:
+{section_text}"""
 
-GENERATED QUESTIONS:
-Topic: {topic}
-{questions_json}
+
+RAG_TRIAD_SYSTEM_PROMPT = """You are an educational content quality evaluator. Assess each generated question provided by the user using the RAG Triad framework.
 
 For EACH question, evaluate on three dimensions (0.0 to 1.0 scale):
 
-1. CONTEXT RELEVANCE: Does the retrieved context contain information relevant to the topic "{topic}"?
+1. CONTEXT RELEVANCE: Does the retrieved context contain information relevant to the given topic?
    - 1.0 = Highly relevant, directly addresses topic
    - 0.5 = Partially relevant, tangential information
    - 0.0 = Irrelevant, no connection to topic
@@ -135,3 +143,12 @@ Return a JSON array with one evaluation object per question, in the same order.
 - issues (list of specific problems, empty if none)
 
 Return ONLY the JSON array."""
+
+
+RAG_TRIAD_USER_PROMPT = """Topic: {topic}
+
+RETRIEVED CONTEXT:
+{context}
+
+GENERATED QUESTIONS:
+{questions_json}"""
@@ -0,0 +1,50 @@
+from typing import Dict, List, Optional, Union
+
+import msgspec
+
+
+# Typed shapes of the JSON the LLM is asked to return. Decoding against these
+# validates the payload and fills defaults for fields the model left out.
+
+class MCQItem(msgspec.Struct):
+    question: str
+    options: Dict[str, str]
+    correct: str
+    explanation: str = ""
+    difficulty: str = "mixed"
+
+
+class FillBlankItem(msgspec.Struct):
+    question: str
+    correct: str
+    explanation: str = ""
+    difficulty: str = "mixed"
+
+
+# Some responses wrap the array as {"questions": [...]}; decode either shape in one pass
+class MCQList(msgspec.Struct):
+    questions: List[MCQItem]
+
+
+class FillBlankList(msgspec.Struct):
+    questions: List[FillBlankItem]
+
+
+class SummaryItem(msgspec.Struct):
+    summary: str
+    section: str = ""
+
+
+# Scores the judge left out stay None rather than reading as a failing 0.0
+class EvalResult(msgspec.Struct):
+    context_relevance_score: Optional[float] = None
+    groundedness_score: Optional[float] = None
+    answer_relevance_score: Optional[float] = None
+    quality_score: Optional[float] = None
+    is_supported: Optional[bool] = None
+    reasoning: str = ""
+    issues: List[str] = []
+
+
+MCQ_RESPONSE = Union[List[MCQItem], MCQList]
+FILL_BLANK_RESPONSE = Union[List[FillBlankItem], FillBlankList]
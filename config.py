@@ -7,29 +7,64 @@ load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 if not GOOGLE_API_KEY:
     raise ValueError("GOOGLE_API_KEY not found in environment variables")
+GEMINI_HTTP_TIMEOUT_MS = 30_000  # Request timeout for the shared google-genai client
 
 # ChromaDB configuration
 CHROMA_DB_PATH = "./chroma_db"
+INGEST_REGISTRY_PATH = "./ingest_registry.sqlite3"  # PDF digest -> ingestion, for deduplicating uploads
 os.environ["ANONYMIZED_TELEMETRY"] = "False"
 
+# Server configuration
+THREADPOOL_SIZE = 64  # Worker threads for blocking pipeline stages
+
+# PDF parsing configuration
+PDF_PARSE_WORKERS = os.cpu_count() or 1
+PDF_PARALLEL_MIN_PAGES = 16  # Smaller PDFs are parsed in-process
+
 # Chunking configuration
 MAX_CHUNK_TOKENS = 200
 CHUNK_OVERLAP_TOKENS = 50
+TOKENIZER_ENCODING = "cl100k_base"  # tiktoken encoding used to count chunk tokens
+
+# Embedding configuration
+EMBEDDING_BATCH_SIZE = 100  # Texts per embed request (Gemini batch limit)
+EMBEDDING_MAX_WORKERS = 8
+EMBEDDING_MAX_RETRIES = 5  # Retries per batch on 429, with exponential backoff
 
 # Retrieval configuration
 DEFAULT_TOP_K = 5
+EMBED_CACHE = os.getenv("EMBED_CACHE", "1") != "0"  # Set EMBED_CACHE=0 to disable the caches below
+QUERY_EMBEDDING_CACHE_SIZE = 4096
+RERANK_SCORE_CACHE_SIZE = 100_000
+DENSE_INDEX_DIR = "./dense_index"  # Per-ingestion int8 NumPy embeddings for in-memory KNN
+DENSE_INDEX_MAX_VECTORS = 10_000  # Larger ingestions are searched through ChromaDB only
+DENSE_INDEX_CACHE_SIZE = 32  # Opened dense indexes kept in memory (least recently used are dropped)
 
 # Generation configuration
 GEMINI_LLM_MODEL = "gemini-2.5-flash"
 GEMINI_EMBEDDING_MODEL = "models/gemini-embedding-001"
 GENERATION_TEMPERATURE = 0.2
+LLM_MAX_CONCURRENCY = 4  # Parallel in-flight LLM calls per request (keep under Gemini QPM)
+QUESTION_CHUNK_GROUPS = 3  # Context groups that MCQ/fill-blank requests are split across
 
 # Judge model configuration
 GEMINI_JUDGE_MODEL = "gemini-2.5-flash"
 JUDGE_TEMPERATURE = 0.0
+CONTEXT_TOKEN_BUDGET = 2000  # Max context tokens shown to the judge
+EVAL_BATCH_SIZE = 8  # Generated items per judge call; batches are judged while generation continues
 
 # Reranker configuration
 RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANKER_BACKEND = "onnx"  # "onnx" (int8 ONNX Runtime) or "torch" (sentence-transformers)
+RERANKER_ONNX_DIR = "./reranker_onnx"  # Cached ONNX export of RERANKER_MODEL
+RERANKER_BATCH_SIZE = 32  # Covers the top_k * 5 candidates in a single forward pass
+
+# Semantic cache configuration (deterministic LLM calls only)
+SEMANTIC_CACHE_DIR = "./semantic_cache"
+SEMANTIC_CACHE_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+SEMANTIC_CACHE_THRESHOLD = 0.92
+SEMANTIC_CACHE_MAX_ENTRIES = 10_000  # Oldest entries are evicted beyond this
+SEMANTIC_CACHE_PERSIST_SECONDS = 60  # Minimum interval between cache writes to disk (flushed at exit)
 
 # Logging configuration
 LOG_DIR = "./logs"
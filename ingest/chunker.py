@@ -1,10 +1,29 @@
+import re
+import time
+import bisect
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from typing import Dict, List
 
-import chromadb
-
-from config import CHROMA_DB_PATH, MAX_CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+from config import (
+    MAX_CHUNK_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MAX_WORKERS,
+    EMBEDDING_MAX_RETRIES,
+)
 from ingest.parser import extract_section_text, table_to_text
-from utils.retrieval import get_embeddings_model
+from utils.dense_index import save_dense_index
+from utils.retrieval import get_chroma_client, get_embeddings_model
+from utils.tokenizer import encode, token_offsets
+
+logger = logging.getLogger(__name__)
+
+# Sentence terminator + space, or a paragraph break. Zero-width so overlapping
+# candidates (e.g. three newlines) all match, mirroring str.rfind.
+_SENTENCE_BOUNDARY_RE = re.compile(r"(?=[.!?] |\n\n)")
 
 
 def sliding_window_chunk(
@@ -12,40 +31,62 @@ def sliding_window_chunk(
     max_tokens: int = MAX_CHUNK_TOKENS,
     overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
 ) -> List[str]:
-    """Split text into overlapping chunks. Uses 4 chars ~ 1 token approximation."""
-    max_chars = max_tokens * 4
-    overlap_chars = overlap_tokens * 4
+    """Split text into overlapping chunks of at most max_tokens tokens."""
+    token_ids = encode(text)
 
-    if len(text) <= max_chars:
+    if len(token_ids) <= max_tokens:
         return [text]
 
+    # Windows are cut in token space but sliced from the original text at
+    # character offsets, so multi-token characters are never split
+    offsets = token_offsets(token_ids) + [len(text)]
+
     chunks = []
     start = 0
 
-    while start < len(text):
-        end = start + max_chars
+    while start < len(token_ids):
+        end = min(start + max_tokens, len(token_ids))
+        window = text[offsets[start]:offsets[end]]
 
         # Break at sentence boundary when possible
-        if end < len(text):
-            search_start = max(start, end - 200)
-            sentence_end = max(
-                text.rfind(". ", search_start, end),
-                text.rfind("! ", search_start, end),
-                text.rfind("? ", search_start, end),
-                text.rfind("\n\n", search_start, end),
-            )
-            if sentence_end > start:
-                end = sentence_end + 1
-
-        chunks.append(text[start:end].strip())
-        start = end - overlap_chars
+        if end < len(token_ids):
+            search_start = max(0, len(window) - 200)
+            sentence_end = -1
+            for match in _SENTENCE_BOUNDARY_RE.finditer(window, search_start):
+                sentence_end = match.start()
+            if sentence_end > 0:
+                cut = offsets[start] + sentence_end + 1
+                # First token starting at or after the cut
+                boundary = bisect.bisect_left(offsets, cut, start, end)
+                if boundary - start > overlap_tokens:
+                    window = text[offsets[start]:cut]
+                    end = boundary
+
+        chunks.append(window.strip())
+        if end >= len(token_ids):
+            break
+        start = end - overlap_tokens
 
     return chunks
 
 
-def create_chunks(pdf_content: Dict, file_name: str) -> List[Dict]:
+@dataclass
+class ChunkBatch:
+    """Chunks stored as parallel lists, in the shape ChromaDB's add() expects."""
+    texts: List[str] = field(default_factory=list)
+    metadatas: List[Dict] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def append(self, text: str, **metadata):
+        self.texts.append(text)
+        self.metadatas.append(metadata)
+
+
+def create_chunks(pdf_content: Dict, file_name: str) -> ChunkBatch:
     """Section-wise chunking with metadata."""
-    chunks = []
+    chunks = ChunkBatch()
     toc_with_pages = pdf_content["toc_with_pages"]
 
     for entry in toc_with_pages:
@@ -53,7 +94,7 @@ def create_chunks(pdf_content: Dict, file_name: str) -> List[Dict]:
         page_start = entry["page_start"]
         page_end = entry["page_end"]
 
-        section_text = extract_section_text(pdf_content["pages_text"], page_start, page_end)
+        section_text = extract_section_text(pdf_content["pages_by_num"], page_start, page_end)
         if not section_text.strip():
             continue
 
@@ -61,65 +102,106 @@ def create_chunks(pdf_content: Dict, file_name: str) -> List[Dict]:
 
         for chunk_text in section_chunks:
             if chunk_text.strip():
-                chunks.append({
-                    "text": chunk_text,
-                    "file_name": file_name,
-                    "chunk_type": "text",
-                    "section_title": section_title,
-                    "page_start": page_start,
-                    "page_end": page_end,
-                })
-
-    # Tables as separate chunks
+                chunks.append(
+                    chunk_text,
+                    file_name=file_name,
+                    chunk_type="text",
+                    section_title=section_title,
+                    section_title_lc=section_title.lower(),
+                    page_start=page_start,
+                    page_end=page_end,
+                )
+
+    # Tables as separate chunks; sections are bisected by start page
+    sections_by_start = sorted(toc_with_pages, key=lambda e: e["page_start"])
+    section_starts = [e["page_start"] for e in sections_by_start]
+
     for table in pdf_content["tables"]:
         table_text = table_to_text(table["data"])
         if not table_text.strip():
             continue
 
         table_page = table["page"]
-        matching_section = next(
-            (e for e in toc_with_pages if e["page_start"] <= table_page <= e["page_end"]),
-            None,
+        idx = bisect.bisect_right(section_starts, table_page) - 1
+        matching_section = (
+            sections_by_start[idx]
+            if idx >= 0 and sections_by_start[idx]["page_end"] >= table_page
+            else None
         )
 
-        chunks.append({
-            "text": table_text,
-            "file_name": file_name,
-            "chunk_type": "table",
-            "section_title": matching_section["section"] if matching_section else "Unknown",
-            "page_start": table_page,
-            "page_end": table_page,
-        })
+        table_section = matching_section["section"] if matching_section else "Unknown"
+        chunks.append(
+            table_text,
+            file_name=file_name,
+            chunk_type="table",
+            section_title=table_section,
+            section_title_lc=table_section.lower(),
+            page_start=table_page,
+            page_end=table_page,
+        )
 
     return chunks
 
 
-def store_chunks_in_db(chunks: List[Dict], ingestion_id: str):
-    """Embed and store chunks in ChromaDB."""
+def _embed_batch(embeddings_model, texts: List[str]) -> List[List[float]]:
+    """Embed one batch, backing off exponentially on rate limits."""
+    for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+        try:
+            return embeddings_model.embed_documents(texts)
+        except Exception as e:
+            if "429" not in str(e) or attempt == EMBEDDING_MAX_RETRIES:
+                raise
+            delay = 2 ** attempt
+            logger.warning(f"Embedding rate limited, retrying in {delay}s (attempt {attempt + 1}/{EMBEDDING_MAX_RETRIES})")
+            time.sleep(delay)
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """Embed texts in parallel batches, returning vectors in input order.
+
+    Identical texts (repeated headers, duplicate tables) are embedded once.
+    """
+    embeddings_model = get_embeddings_model()
+    unique_texts = list(dict.fromkeys(texts))
+    if len(unique_texts) < len(texts):
+        logger.info(f"Embedding {len(unique_texts)} unique texts out of {len(texts)}")
+    batches = [unique_texts[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(unique_texts), EMBEDDING_BATCH_SIZE)]
+
+    with ThreadPoolExecutor(max_workers=min(EMBEDDING_MAX_WORKERS, len(batches))) as executor:
+        # Each batch runs in a copy of the caller's context so its logs reach the request's log file
+        futures = [
+            executor.submit(contextvars.copy_context().run, _embed_batch, embeddings_model, batch)
+            for batch in batches
+        ]
+        vectors = [vector for future in futures for vector in future.result()]
+
+    vectors_by_text = dict(zip(unique_texts, vectors))
+    return [vectors_by_text[text] for text in texts]
+
+
+def store_chunks_in_db(chunks: ChunkBatch, ingestion_id: str):
+    """Embed and store chunks in ChromaDB, plus a dense index for small ingestions."""
     if not chunks:
         return
 
-    embeddings_model = get_embeddings_model()
-    texts = [chunk["text"] for chunk in chunks]
-    embeddings = embeddings_model.embed_documents(texts)
-
-    chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-    collection = chroma_client.get_or_create_collection(name=f"ingestion_{ingestion_id}")
-
-    metadatas = [
-        {
-            "file_name": c["file_name"],
-            "chunk_type": c["chunk_type"],
-            "section_title": c["section_title"],
-            "page_start": c["page_start"],
-            "page_end": c["page_end"],
-        }
-        for c in chunks
-    ]
+    embeddings = embed_texts(chunks.texts)
+
+    chroma_client = get_chroma_client()
+    # Vectors are computed here (batched, with retrieval-specific task types), so
+    # Chroma's bundled ONNX embedding function is never needed
+    collection = chroma_client.get_or_create_collection(
+        name=f"ingestion_{ingestion_id}",
+        embedding_function=None,
+    )
 
     collection.add(
         embeddings=embeddings,
-        documents=texts,
-        metadatas=metadatas,
+        documents=chunks.texts,
+        metadatas=chunks.metadatas,
         ids=[f"{ingestion_id}_chunk_{i}" for i in range(len(chunks))],
     )
+
+    try:
+        save_dense_index(ingestion_id, embeddings, chunks.texts, chunks.metadatas)
+    except Exception as e:
+        logger.error(f"Failed to save dense index ({e}), retrieval will use ChromaDB")
@@ -1,6 +1,70 @@
 import re
-import pdfplumber
-from typing import Dict, List
+import math
+import logging
+import threading
+import multiprocessing
+import pymupdf
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+from multiprocessing import shared_memory
+from typing import Dict, List, Tuple, Union
+
+from config import PDF_PARSE_WORKERS, PDF_PARALLEL_MIN_PAGES
+
+logger = logging.getLogger(__name__)
+
+# Line classifiers, compiled once at import instead of per line
+_TOC_CHAPTER_RE = re.compile(r"^Chapter\s+(\d+)[\:\s]+(.+?)[\s\.]+(\d+)\s*$", re.IGNORECASE)
+_TOC_NUMBERED_RE = re.compile(r"^(\d+(?:\.\d+)?)[\.\s]+([A-Z].+?)[\s\.]+(\d+)\s*$", re.IGNORECASE)
+_HEADING_CHAPTER_RE = re.compile(r"^Chapter\s+(\d+)[\:\s]*(.*)$", re.IGNORECASE)
+_HEADING_NUMBERED_RE = re.compile(r"^(\d+(?:\.\d+)?)[\.\s]+([A-Z][A-Za-z\s]{3,60})$")
+_TRAILING_DOTS_RE = re.compile(r"\.+$")
+
+# Multiline so numbered TOC lines are counted straight off the page text without
+# splitting it; [^\S\n] keeps whitespace matches inside a single line.
+_TOC_LINE_RE = re.compile(r"^[^\S\n]*(?:Chapter[^\S\n]+)?\d+[\.\:)]", re.IGNORECASE | re.MULTILINE)
+
+_TOC_INDICATORS = ("table of contents", "contents", "table of content")
+
+# Lazy-started worker pool, shared by all ingests
+_PDF_POOL = None
+_PDF_POOL_LOCK = threading.Lock()
+
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    """Return the process-wide PDF parsing pool.
+
+    Workers come from a forkserver rather than fork(), so they never inherit the
+    server's threads or any lock held by MuPDF, ONNX Runtime or torch.
+    """
+    global _PDF_POOL
+    if _PDF_POOL is None:
+        with _PDF_POOL_LOCK:
+            if _PDF_POOL is None:
+                _PDF_POOL = ProcessPoolExecutor(
+                    max_workers=PDF_PARSE_WORKERS,
+                    mp_context=multiprocessing.get_context("forkserver"),
+                )
+    return _PDF_POOL
+
+
+def shutdown_pdf_pool():
+    global _PDF_POOL
+    with _PDF_POOL_LOCK:
+        if _PDF_POOL is not None:
+            _PDF_POOL.shutdown(cancel_futures=True)
+            _PDF_POOL = None
+
+
+def _reset_pdf_pool(broken: ProcessPoolExecutor):
+    """Drop a pool whose worker died, so the next get_pdf_pool() builds a fresh one."""
+    global _PDF_POOL
+    with _PDF_POOL_LOCK:
+        # Another ingest may already have replaced it
+        if _PDF_POOL is broken:
+            _PDF_POOL = None
+    broken.shutdown(wait=False, cancel_futures=True)
 
 
 def detect_toc_page(pages_text: List[Dict]) -> int:
@@ -12,15 +76,14 @@ def detect_toc_page(pages_text: List[Dict]) -> int:
         if not text:
             continue
 
-        first_300 = text.lower()[:300]
-        toc_indicators = ["table of contents", "contents", "table of content"]
-        has_toc_marker = any(ind in first_300 for ind in toc_indicators)
+        first_300 = text[:300].lower()
+        has_toc_marker = any(ind in first_300 for ind in _TOC_INDICATORS)
 
-        lines = text.split("\n")
-        numbered_lines = sum(
-            1 for line in lines
-            if re.match(r"^\s*(?:Chapter\s+)?\d+[\.\:)]", line.strip(), re.IGNORECASE)
-        )
+        numbered_lines = 0
+        for _ in _TOC_LINE_RE.finditer(text):
+            numbered_lines += 1
+            if numbered_lines >= 5:
+                break
 
         if numbered_lines >= 5 or (has_toc_marker and numbered_lines >= 3):
             return idx
@@ -39,23 +102,19 @@ def extract_toc_from_page(page_text: str) -> List[Dict]:
             continue
 
         # Pattern: "Chapter N: Title ..... page"
-        chapter_match = re.match(
-            r"^Chapter\s+(\d+)[\:\s]+(.+?)[\s\.]+(\d+)\s*$", line, re.IGNORECASE
-        )
+        chapter_match = _TOC_CHAPTER_RE.match(line)
         if chapter_match:
             num, title, page_num = chapter_match.group(1), chapter_match.group(2).strip(), int(chapter_match.group(3))
             if num in seen_numbers and len(toc) >= 5:
                 return toc
             seen_numbers.add(num)
-            title = re.sub(r"\.+$", "", title).strip()
+            title = _TRAILING_DOTS_RE.sub("", title).strip()
             if len(title) > 3:
                 toc.append({"section": f"Chapter {num}: {title}", "page_num": page_num})
                 continue
 
         # Pattern: "N. Title ..... page" or "N.M Title ..... page"
-        numbered_match = re.match(
-            r"^(\d+(?:\.\d+)?)[\.\s]+([A-Z].+?)[\s\.]+(\d+)\s*$", line, re.IGNORECASE
-        )
+        numbered_match = _TOC_NUMBERED_RE.match(line)
         if numbered_match:
             num = numbered_match.group(1).split(".")[0]
             title = numbered_match.group(2).strip()
@@ -63,7 +122,7 @@ def extract_toc_from_page(page_text: str) -> List[Dict]:
             if num in seen_numbers and len(toc) >= 5:
                 return toc
             seen_numbers.add(num)
-            title = re.sub(r"\.+$", "", title).strip()
+            title = _TRAILING_DOTS_RE.sub("", title).strip()
             if len(title) > 5 and title[0].isupper():
                 toc.append({"section": f"{numbered_match.group(1)} {title}", "page_num": page_num})
                 continue
@@ -86,7 +145,7 @@ def scan_for_headings(pages_text: List[Dict]) -> List[Dict]:
                 continue
 
             # "Chapter N" pattern
-            chapter_match = re.match(r"^Chapter\s+(\d+)[\:\s]*(.*)$", line, re.IGNORECASE)
+            chapter_match = _HEADING_CHAPTER_RE.match(line)
             if chapter_match:
                 num = chapter_match.group(1)
                 title = chapter_match.group(2).strip()
@@ -101,7 +160,7 @@ def scan_for_headings(pages_text: List[Dict]) -> List[Dict]:
                 continue
 
             # Numbered sections: "N. Title" or "N.M Title"
-            numbered_match = re.match(r"^(\d+(?:\.\d+)?)[\.\s]+([A-Z][A-Za-z\s]{3,60})$", line)
+            numbered_match = _HEADING_NUMBERED_RE.match(line)
             if numbered_match:
                 num = numbered_match.group(1).split(".")[0]
                 title = numbered_match.group(2).strip()
@@ -123,8 +182,23 @@ def scan_for_headings(pages_text: List[Dict]) -> List[Dict]:
     return headings
 
 
-def detect_headings_from_text(pages_text: List[Dict]) -> List[Dict]:
+def toc_from_outline(outline: List[List]) -> List[Dict]:
+    """Build TOC entries from the PDF's embedded outline (bookmarks), using top-level entries only."""
+    return [
+        {"section": title.strip(), "page_num": page}
+        for level, title, page in outline
+        if level == 1 and page > 0 and title.strip()
+    ]
+
+
+def detect_headings_from_text(pages_text: List[Dict], outline: List[List] = None) -> List[Dict]:
     """Smart TOC extraction with multiple strategies."""
+    # Strategy 0: Embedded PDF outline, which carries exact physical page numbers
+    if outline:
+        toc = toc_from_outline(outline)
+        if len(toc) >= 3:
+            return toc
+
     # Strategy 1: Find explicit TOC page
     toc_page_idx = detect_toc_page(pages_text)
     if toc_page_idx != -1:
@@ -190,37 +264,108 @@ def table_to_text(table_data: List[List]) -> str:
     return "\n".join(rows)
 
 
-def extract_pdf_content(pdf_path: str) -> Dict:
-    """Extract text, tables, and TOC from PDF with section-to-page mapping."""
+def _open_pdf(source: Union[str, bytes]) -> pymupdf.Document:
+    """Open a PDF from a file path or from its raw bytes."""
+    if isinstance(source, (bytes, bytearray)):
+        return pymupdf.open(stream=source, filetype="pdf")
+    return pymupdf.open(source)
+
+
+def _parse_page_range(source: Union[str, bytes], start: int, stop: int) -> Tuple[List[Dict], List[Dict]]:
+    """Extract text and tables for pages [start, stop). Opens its own handle so it can run in a worker process."""
     pages_text = []
     tables = []
 
-    with pdfplumber.open(pdf_path) as pdf:
-        for i, page in enumerate(pdf.pages):
-            text = page.extract_text() or ""
+    doc = _open_pdf(source)
+    try:
+        for i in range(start, stop):
+            page = doc[i]
+            text = page.get_text("text", sort=True)
             pages_text.append({"page_num": i + 1, "text": text})
             try:
-                page_tables = page.extract_tables()
-                if page_tables:
-                    tables.extend([{"page": i + 1, "data": t} for t in page_tables if t])
+                for table in page.find_tables().tables:
+                    data = table.extract()
+                    if data:
+                        tables.append({"page": i + 1, "data": data})
             except Exception:
                 pass
+    finally:
+        doc.close()
+
+    return pages_text, tables
+
 
-    toc = detect_headings_from_text(pages_text)
+def _parse_shared_range(shm_name: str, size: int, start: int, stop: int) -> Tuple[List[Dict], List[Dict]]:
+    """_parse_page_range for PDF bytes the parent placed in shared memory, so they are not pickled per worker."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        source = bytes(shm.buf[:size])
+    finally:
+        shm.close()
+    return _parse_page_range(source, start, stop)
+
+
+def _map_page_ranges(source: Union[str, bytes], starts: List[int], stops: List[int]) -> List[Tuple[List[Dict], List[Dict]]]:
+    """Parse each [start, stop) range on the worker pool.
+
+    If a worker dies (MuPDF crash, OOM) the pool is broken for good; it is replaced
+    and the ranges are parsed in this process instead, so later ingests still work.
+    """
+    pool = get_pdf_pool()
+    try:
+        if not isinstance(source, (bytes, bytearray)):
+            return list(pool.map(_parse_page_range, repeat(source), starts, stops))
+
+        # Copy the PDF into one shared segment; workers attach to it by name
+        shm = shared_memory.SharedMemory(create=True, size=len(source))
+        try:
+            shm.buf[:len(source)] = source
+            return list(pool.map(_parse_shared_range, repeat(shm.name), repeat(len(source)), starts, stops))
+        finally:
+            shm.close()
+            shm.unlink()
+    except BrokenProcessPool as e:
+        logger.error(f"PDF parsing pool broke ({e}), rebuilding it and parsing in-process")
+        _reset_pdf_pool(pool)
+        return [_parse_page_range(source, start, stop) for start, stop in zip(starts, stops)]
+
+
+def extract_pdf_content(source: Union[str, bytes]) -> Dict:
+    """Extract text, tables, and TOC from a PDF path or in-memory PDF bytes, with section-to-page mapping."""
+    doc = _open_pdf(source)
+    try:
+        n_pages = doc.page_count
+        outline = doc.get_toc()
+    finally:
+        doc.close()
+
+    workers = min(PDF_PARSE_WORKERS, n_pages)
+    if workers <= 1 or n_pages < PDF_PARALLEL_MIN_PAGES:
+        pages_text, tables = _parse_page_range(source, 0, n_pages)
+    else:
+        # One contiguous page range per worker amortizes the cost of opening the PDF
+        step = math.ceil(n_pages / workers)
+        starts = list(range(0, n_pages, step))
+        stops = [min(s + step, n_pages) for s in starts]
+        pages_text, tables = [], []
+        for range_text, range_tables in _map_page_ranges(source, starts, stops):
+            pages_text.extend(range_text)
+            tables.extend(range_tables)
+
+    toc = detect_headings_from_text(pages_text, outline)
     toc_with_pages = map_sections_to_pages(toc, pages_text)
 
     return {
         "pages_text": pages_text,
+        "pages_by_num": {p["page_num"]: p["text"] for p in pages_text},
         "tables": tables,
         "toc": toc,
         "toc_with_pages": toc_with_pages,
     }
 
 
-def extract_section_text(pages_text: List[Dict], page_start: int, page_end: int) -> str:
+def extract_section_text(pages_by_num: Dict[int, str], page_start: int, page_end: int) -> str:
     """Extract text from a specific page range."""
-    section_texts = []
-    for page_data in pages_text:
-        if page_start <= page_data["page_num"] <= page_end:
-            section_texts.append(page_data["text"])
-    return "\n\n".join(section_texts)
+    return "\n\n".join(
+        pages_by_num[n] for n in range(page_start, page_end + 1) if n in pages_by_num
+    )
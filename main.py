@@ -1,12 +1,18 @@
 import os
 import uuid
 import time
+import asyncio
 import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import aiofiles
+import anyio.to_thread
+from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
-from config import GEMINI_LLM_MODEL
+from config import GEMINI_LLM_MODEL, THREADPOOL_SIZE
 from models import (
     IngestResponse,
     GenerateRequest,
@@ -15,18 +21,37 @@ from models import (
     IngestStats,
     ParsedIntent,
     GenerateMetadata,
+    INGEST_RESPONSE_ADAPTER,
+    GENERATE_RESPONSE_ADAPTER,
 )
-from ingest.parser import extract_pdf_content
+from ingest.parser import extract_pdf_content, get_pdf_pool, shutdown_pdf_pool
 from ingest.chunker import create_chunks, store_chunks_in_db
 from agents.generator import (
     parse_intent,
-    generate_mcqs,
-    generate_fill_blanks,
-    generate_summaries,
+    aiter_mcqs,
+    aiter_fill_blanks,
+    aiter_summaries,
+)
+from agents.pipeline import EvaluationError, generate_and_evaluate
+from utils.retrieval import (
+    get_chroma_client,
+    get_collection,
+    get_cross_encoder,
+    get_embeddings_model,
+    get_genai_client,
+    retrieve_context,
 )
-from utils.retrieval import retrieve_context
-from agents.evaluation import evaluate_batch
 from utils.log_handler import request_logger
+from utils.tokenizer import get_encoding
+from utils.ingest_registry import pdf_digest, lookup_ingestion, register_ingestion
+
+# Item generator for each supported intent mode
+CONTENT_GENERATORS = {
+    "mcq": aiter_mcqs,
+    "fill_blank": aiter_fill_blanks,
+    "summary": aiter_summaries,
+    "summary_per_section": aiter_summaries,
+}
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
@@ -35,6 +60,7 @@ app = FastAPI(
     title="Educational Content Generator",
     description="RAG-based system for generating MCQs, fill-in-the-blanks, and summaries from PDFs",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
 )
 
 app.add_middleware(
@@ -46,13 +72,55 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def configure_threadpools():
+    """Size both thread pools that blocking pipeline stages run on."""
+    # asyncio.to_thread uses the loop's default executor
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=THREADPOOL_SIZE))
+    # Starlette's run_in_threadpool (e.g. UploadFile I/O) uses anyio's limiter
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+
+@app.on_event("startup")
+async def warm_shared_clients():
+    """Build the PDF parsing pool, Chroma client, Gemini client, embeddings model, reranker, and tokenizer before the first request needs them.
+
+    Warm-up is best effort: a failure (e.g. the reranker can't be downloaded) is
+    logged and the lazy getter retries on first use, so the server still starts.
+    """
+    getters = [get_genai_client, get_pdf_pool, get_chroma_client, get_embeddings_model, get_cross_encoder, get_encoding]
+    results = await asyncio.gather(
+        *(asyncio.to_thread(getter) for getter in getters),
+        return_exceptions=True,
+    )
+    for getter, result in zip(getters, results):
+        if isinstance(result, Exception):
+            logger.error(f"Startup warm-up of {getter.__name__} failed ({result}), will retry on first use")
+
+
+async def save_upload(pdf_path: str, content: bytes):
+    """Persist an uploaded PDF for auditing; runs after the ingest response is sent, or before an ingest error is raised."""
+    try:
+        async with aiofiles.open(pdf_path, "wb") as f:
+            await f.write(content)
+        logger.info(f"Saved PDF to {pdf_path} ({len(content)} bytes)")
+    except Exception as e:
+        logger.error(f"Failed to save file {pdf_path}: {e}")
+
+
+@app.on_event("shutdown")
+def stop_pdf_pool():
+    shutdown_pdf_pool()
+
+
 @app.get("/")
 async def root():
     return {"status": "healthy", "service": "Educational Content Generator", "version": "1.0.0"}
 
 
-@app.post("/ingest", response_model=IngestResponse)
-async def ingest_pdf(file: UploadFile = File(...)):
+# Responses are serialized by their TypeAdapters; `responses` keeps the OpenAPI schema
+@app.post("/ingest", response_model=None, responses={200: {"model": IngestResponse}})
+async def ingest_pdf(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     """Ingest PDF: parse -> chunk -> embed -> store in ChromaDB."""
     if not file.filename.endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
@@ -62,45 +130,60 @@ async def ingest_pdf(file: UploadFile = File(...)):
     with request_logger(ingestion_id):
         logger.info(f"=== INGEST START: {file.filename} | ingestion_id={ingestion_id} ===")
 
-        # Save uploaded file
+        # Read upload; it is parsed from memory and written to disk after the response
+        try:
+            content = await file.read()
+            logger.info(f"Received PDF ({len(content)} bytes)")
+        except Exception as e:
+            logger.error(f"Failed to read file: {e}")
+            raise HTTPException(status_code=500, detail=f"Failed to read file: {str(e)}")
+
+        # Identical PDFs reuse their earlier ingestion while its collection still exists
+        digest = await asyncio.to_thread(pdf_digest, content)
+        previous = await asyncio.to_thread(lookup_ingestion, digest)
+        if previous is not None:
+            previous_id, previous_response = previous
+            if await asyncio.to_thread(get_collection, previous_id) is not None:
+                logger.info(f"=== INGEST DEDUPLICATED: {file.filename} matches ingestion_id={previous_id} ===")
+                response = IngestResponse.model_validate_json(previous_response)
+                response = response.model_copy(update={"file_name": file.filename})
+                return ORJSONResponse(INGEST_RESPONSE_ADAPTER.dump_python(response))
+
         upload_dir = "./uploaded_pdfs"
         os.makedirs(upload_dir, exist_ok=True)
         pdf_path = f"{upload_dir}/{ingestion_id}_{file.filename}"
 
         try:
-            with open(pdf_path, "wb") as f:
-                content = await file.read()
-                f.write(content)
-            logger.info(f"Saved PDF to {pdf_path} ({len(content)} bytes)")
-        except Exception as e:
-            logger.error(f"Failed to save file: {e}")
-            raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+            # Parse PDF
+            try:
+                pdf_content = await asyncio.to_thread(extract_pdf_content, content)
+                logger.info(f"Parsed PDF: {len(pdf_content['pages_text'])} pages, {len(pdf_content['toc'])} TOC entries, {len(pdf_content['tables'])} tables")
+            except Exception as e:
+                logger.error(f"Failed to parse PDF: {e}")
+                raise HTTPException(status_code=500, detail=f"Failed to parse PDF: {str(e)}")
 
-        # Parse PDF
-        try:
-            pdf_content = extract_pdf_content(pdf_path)
-            logger.info(f"Parsed PDF: {len(pdf_content['pages_text'])} pages, {len(pdf_content['toc'])} TOC entries, {len(pdf_content['tables'])} tables")
-        except Exception as e:
-            logger.error(f"Failed to parse PDF: {e}")
-            raise HTTPException(status_code=500, detail=f"Failed to parse PDF: {str(e)}")
+            # Chunk
+            try:
+                chunks = await asyncio.to_thread(create_chunks, pdf_content, file.filename)
+                chunk_types = Counter(m["chunk_type"] for m in chunks.metadatas)
+                n_text, n_tables = chunk_types["text"], chunk_types["table"]
+                logger.info(f"Chunking complete: {len(chunks)} total chunks ({n_text} text, {n_tables} table)")
+            except Exception as e:
+                logger.error(f"Failed to chunk PDF: {e}")
+                raise HTTPException(status_code=500, detail=f"Failed to chunk PDF: {str(e)}")
 
-        # Chunk
-        try:
-            chunks = create_chunks(pdf_content, file.filename)
-            n_text = len([c for c in chunks if c["chunk_type"] == "text"])
-            n_tables = len([c for c in chunks if c["chunk_type"] == "table"])
-            logger.info(f"Chunking complete: {len(chunks)} total chunks ({n_text} text, {n_tables} table)")
-        except Exception as e:
-            logger.error(f"Failed to chunk PDF: {e}")
-            raise HTTPException(status_code=500, detail=f"Failed to chunk PDF: {str(e)}")
-
-        # Embed & store
-        try:
-            store_chunks_in_db(chunks, ingestion_id)
-            logger.info(f"Stored {len(chunks)} chunks in ChromaDB collection ingestion_{ingestion_id}")
-        except Exception as e:
-            logger.error(f"Failed to store chunks: {e}")
-            raise HTTPException(status_code=500, detail=f"Failed to store chunks: {str(e)}")
+            # Embed & store
+            try:
+                await asyncio.to_thread(store_chunks_in_db, chunks, ingestion_id)
+                logger.info(f"Stored {len(chunks)} chunks in ChromaDB collection ingestion_{ingestion_id}")
+            except Exception as e:
+                logger.error(f"Failed to store chunks: {e}")
+                raise HTTPException(status_code=500, detail=f"Failed to store chunks: {str(e)}")
+        except HTTPException:
+            # Background tasks are dropped when the request fails, so failed uploads are saved inline
+            await save_upload(pdf_path, content)
+            raise
+        background_tasks.add_task(save_upload, pdf_path, content)
 
         toc = [TOCEntry(section=entry["section"]) for entry in pdf_content["toc"]]
         response = IngestResponse(
@@ -112,11 +195,16 @@ async def ingest_pdf(file: UploadFile = File(...)):
             stats=IngestStats(n_chunks=len(chunks), n_tables=n_tables, n_equations=0),
         )
 
+        try:
+            await asyncio.to_thread(register_ingestion, digest, ingestion_id, response.model_dump_json())
+        except Exception as e:
+            logger.error(f"Failed to register ingestion for deduplication: {e}")
+
         logger.info(f"=== INGEST COMPLETE: {ingestion_id} | {len(chunks)} chunks from {len(pdf_content['pages_text'])} pages ===")
-        return response
+        return ORJSONResponse(INGEST_RESPONSE_ADAPTER.dump_python(response))
 
 
-@app.post("/generate", response_model=GenerateResponse)
+@app.post("/generate", response_model=None, responses={200: {"model": GenerateResponse}})
 async def generate_content(request: GenerateRequest):
     """Generate learning content: parse intent -> retrieve -> generate -> evaluate."""
     request_id = str(uuid.uuid4())
@@ -125,91 +213,94 @@ async def generate_content(request: GenerateRequest):
         logger.info(f"=== GENERATE START: request_id={request_id} | ingestion_id={request.ingestion_id} ===")
         logger.info(f"User prompt: {request.user_prompt}")
 
-        # Step 1: Parse intent
+        # Step 1: Parse intent while opening the collection
         try:
-            intent = parse_intent(request.user_prompt)
+            intent, collection = await asyncio.gather(
+                asyncio.to_thread(parse_intent, request.user_prompt),
+                asyncio.to_thread(get_collection, request.ingestion_id),
+            )
             logger.info(f"Parsed intent: mode={intent['mode']}, topic={intent.get('topic')}, n={intent['n']}, difficulty={intent['difficulty']}")
         except Exception as e:
             logger.error(f"Intent parsing failed: {e}")
             raise HTTPException(status_code=500, detail=f"Failed to parse intent: {str(e)}")
 
+        # Reject unusable intents before spending an embedding call and a vector search
+        if intent["mode"] not in CONTENT_GENERATORS:
+            logger.error(f"Unknown mode: {intent['mode']}")
+            raise HTTPException(status_code=400, detail=f"Unknown mode: {intent['mode']}")
+        if not isinstance(intent.get("n"), int) or intent["n"] <= 0:
+            logger.error(f"Invalid item count: {intent.get('n')}")
+            raise HTTPException(status_code=400, detail=f"Number of items must be a positive integer, got {intent.get('n')!r}")
+
+        if collection is None:
+            logger.error(f"No content found for ingestion_id: {request.ingestion_id}")
+            raise HTTPException(status_code=404, detail=f"No content found for ingestion_id: {request.ingestion_id}")
+
         # Step 2: Retrieve context
-        retrieval_start = time.time()
+        retrieval_start = time.perf_counter_ns()
         try:
-            context_chunks, context_metadata = retrieve_context(
+            context_chunks, context_metadata = await asyncio.to_thread(
+                retrieve_context,
                 ingestion_id=request.ingestion_id,
                 query=request.user_prompt,
                 topic=intent.get("topic"),
                 top_k=5,
+                collection=collection,
             )
         except Exception as e:
             logger.error(f"Retrieval failed: {e}")
             raise HTTPException(status_code=500, detail=f"Failed to retrieve context: {str(e)}")
-        retrieval_time = (time.time() - retrieval_start) * 1000
-        logger.info(f"Retrieved {len(context_chunks)} chunks in {retrieval_time:.0f}ms")
+        retrieval_ms = (time.perf_counter_ns() - retrieval_start) // 1_000_000
+        logger.info(f"Retrieved {len(context_chunks)} chunks in {retrieval_ms}ms")
 
         if not context_chunks:
             logger.error(f"No content found for ingestion_id: {request.ingestion_id}")
             raise HTTPException(status_code=404, detail=f"No content found for ingestion_id: {request.ingestion_id}")
 
-        # Step 3: Generate content
-        generation_start = time.time()
-        try:
-            if intent["mode"] == "mcq":
-                questions = generate_mcqs(context_chunks, context_metadata, intent)
-            elif intent["mode"] == "fill_blank":
-                questions = generate_fill_blanks(context_chunks, context_metadata, intent)
-            elif intent["mode"] in ["summary", "summary_per_section"]:
-                questions = generate_summaries(context_chunks, context_metadata, intent)
-            else:
-                raise HTTPException(status_code=400, detail=f"Unknown mode: {intent['mode']}")
-        except HTTPException:
-            raise
-        except Exception as e:
-            error_msg = str(e)
-            logger.error(f"Generation failed: {error_msg}")
-            if "404" in error_msg:
-                raise HTTPException(status_code=502, detail=f"LLM model not found: {error_msg}")
-            elif "429" in error_msg:
-                raise HTTPException(status_code=429, detail=f"LLM rate limit exceeded: {error_msg}")
-            else:
-                raise HTTPException(status_code=500, detail=f"Content generation failed: {error_msg}")
-        generation_time = (time.time() - generation_start) * 1000
-        logger.info(f"Generated {len(questions)} items in {generation_time:.0f}ms")
-
-        # Step 4: Evaluate with RAG Triad (single batched call)
-        eval_start = time.time()
+        # Steps 3 & 4: Generate content, evaluating each batch with the RAG Triad
+        # as soon as it is generated rather than after all generation finishes
+        items = CONTENT_GENERATORS[intent["mode"]](context_chunks, context_metadata, intent)
+        generation_start = time.perf_counter_ns()
         context_text = "\n\n".join(context_chunks)
         try:
-            evaluations = evaluate_batch(
-                questions=questions,
+            questions, generation_ms = await generate_and_evaluate(
+                items,
                 context=context_text,
                 topic=intent.get("topic", "the document"),
             )
-            for q, eval_result in zip(questions, evaluations):
-                q["evaluator"] = eval_result
-        except Exception as e:
+        except EvaluationError as e:
             error_msg = str(e)
             logger.error(f"Evaluation failed: {error_msg}")
             if "429" in error_msg:
                 raise HTTPException(status_code=429, detail=f"LLM rate limit exceeded during evaluation: {error_msg}")
             raise HTTPException(status_code=500, detail=f"Evaluation failed: {error_msg}")
-        eval_time = (time.time() - eval_start) * 1000
-        logger.info(f"Evaluation complete in {eval_time:.0f}ms")
+        except Exception as e:
+            error_msg = str(e)
+            logger.error(f"Generation failed: {error_msg}")
+            if "404" in error_msg:
+                raise HTTPException(status_code=502, detail=f"LLM model not found: {error_msg}")
+            elif "429" in error_msg:
+                raise HTTPException(status_code=429, detail=f"LLM rate limit exceeded: {error_msg}")
+            else:
+                raise HTTPException(status_code=500, detail=f"Content generation failed: {error_msg}")
+        logger.info(f"Generated {len(questions)} items in {generation_ms}ms")
+        # Evaluation overlaps generation; this is the time it added after the last item
+        eval_ms = (time.perf_counter_ns() - generation_start) // 1_000_000 - generation_ms
+        logger.info(f"Evaluation complete {eval_ms}ms after generation")
 
         response = GenerateResponse(
             request_id=request_id,
             generated_learning_content=questions,
             metadata=GenerateMetadata(
                 parsed_intent=ParsedIntent(**intent),
-                retrieval_time_ms=int(retrieval_time),
-                generation_time_ms=int(generation_time),
+                retrieval_time_ms=retrieval_ms,
+                generation_time_ms=generation_ms,
                 model=GEMINI_LLM_MODEL,
             ),
         )
 
-        logger.info(f"=== GENERATE COMPLETE: {request_id} | {len(questions)} items, retrieval={retrieval_time:.0f}ms, generation={generation_time:.0f}ms, eval={eval_time:.0f}ms ===")
-        return response
+        logger.info(f"=== GENERATE COMPLETE: {request_id} | {len(questions)} items, retrieval={retrieval_ms}ms, generation={generation_ms}ms, eval={eval_ms}ms ===")
+        return ORJSONResponse(GENERATE_RESPONSE_ADAPTER.dump_python(response))
 
 
 if __name__ == "__main__":
@@ -1,18 +1,22 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
 from typing import List, Dict, Optional, Any
 
 
-class TOCEntry(BaseModel):
+class APIModel(BaseModel):
+    model_config = ConfigDict(extra="ignore", populate_by_name=True)
+
+
+class TOCEntry(APIModel):
     section: str
 
 
-class IngestStats(BaseModel):
+class IngestStats(APIModel):
     n_chunks: int
     n_tables: int
     n_equations: int
 
 
-class IngestResponse(BaseModel):
+class IngestResponse(APIModel):
     ingestion_id: str
     file_name: str
     pages: int
@@ -21,12 +25,12 @@ class IngestResponse(BaseModel):
     stats: IngestStats
 
 
-class GenerateRequest(BaseModel):
+class GenerateRequest(APIModel):
     ingestion_id: str
     user_prompt: str = Field(..., description="Free-form text describing what to generate")
 
 
-class MCQQuestion(BaseModel):
+class MCQQuestion(APIModel):
     id: str
     question: str
     options: Dict[str, str]
@@ -36,7 +40,7 @@ class MCQQuestion(BaseModel):
     evaluator: Optional[Dict[str, Any]] = None
 
 
-class FillBlankQuestion(BaseModel):
+class FillBlankQuestion(APIModel):
     id: str
     question: str
     correct: str
@@ -45,14 +49,14 @@ class FillBlankQuestion(BaseModel):
     evaluator: Optional[Dict[str, Any]] = None
 
 
-class Summary(BaseModel):
+class Summary(APIModel):
     id: str
     summary: str
     section: str
     evaluator: Optional[Dict[str, Any]] = None
 
 
-class ParsedIntent(BaseModel):
+class ParsedIntent(APIModel):
     mode: str
     topic: Optional[str]
     n: int
@@ -60,14 +64,19 @@ class ParsedIntent(BaseModel):
     global_scope: bool
 
 
-class GenerateMetadata(BaseModel):
+class GenerateMetadata(APIModel):
     parsed_intent: ParsedIntent
     retrieval_time_ms: int
     generation_time_ms: int
     model: str
 
 
-class GenerateResponse(BaseModel):
+class GenerateResponse(APIModel):
     request_id: str
     generated_learning_content: List[Dict[str, Any]]
     metadata: GenerateMetadata
+
+
+# Built once at import; endpoints serialize their responses through these
+INGEST_RESPONSE_ADAPTER = TypeAdapter(IngestResponse)
+GENERATE_RESPONSE_ADAPTER = TypeAdapter(GenerateResponse)
@@ -0,0 +1,63 @@
+import os
+import re
+import random
+import asyncio
+
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+
+import orjson
+import pytest
+
+from agents import generator
+
+
+class _FakeResponse:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class _FakeLLM:
+    """Answers each group after a random delay with as many MCQs as its prompt asks for."""
+
+    def __init__(self):
+        self.requested = []
+
+    async def ainvoke(self, messages):
+        prompt = messages[-1][1]
+        n = int(re.search(r"Number of questions: (\d+)", prompt).group(1))
+        chunks = re.findall(r"\]\n(chunk\d+)", prompt)
+        self.requested.append((n, chunks))
+        await asyncio.sleep(random.random() / 50)
+        questions = [
+            {"question": f"{chunks[0]}#{i}", "options": {"A": "a", "B": "b"}, "correct": "A"}
+            for i in range(n)
+        ]
+        return _FakeResponse(orjson.dumps(questions).decode())
+
+
+def _context(n_chunks: int):
+    chunks = [f"chunk{i}" for i in range(n_chunks)]
+    metas = [{"section_title": f"Section {i}", "page": i + 1} for i in range(n_chunks)]
+    return chunks, metas
+
+
+@pytest.mark.parametrize("n", [1, 3, 4, 7, 10])
+def test_mcqs_split_n_across_every_group_in_order(monkeypatch, n):
+    llm = _FakeLLM()
+    monkeypatch.setattr(generator, "_get_llm", lambda temperature=None: llm)
+    chunks, metas = _context(5)
+
+    questions = asyncio.run(generator.agenerate_mcqs(chunks, metas, {"n": n, "difficulty": "easy"}))
+
+    # Each group is asked for exactly its share, and nothing is generated only to be dropped
+    assert sum(requested for requested, _ in llm.requested) == n
+    assert all(requested >= 1 for requested, _ in llm.requested)
+    assert len(questions) == n
+
+    # Every retrieved chunk reaches a prompt
+    assert sorted(c for _, group in llm.requested for c in group) == sorted(chunks)
+
+    # Results come back in group order, whichever group answered first
+    first_chunks = [int(q["question"].split("#")[0][len("chunk"):]) for q in questions]
+    assert first_chunks == sorted(first_chunks)
+    assert len({q["id"] for q in questions}) == n
@@ -0,0 +1,117 @@
+import os
+import pickle
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import DENSE_INDEX_CACHE_SIZE, DENSE_INDEX_DIR, DENSE_INDEX_MAX_VECTORS
+
+logger = logging.getLogger(__name__)
+
+_EMBEDDINGS_FILE = "embeddings_int8.npy"
+_SCALES_FILE = "scales.npy"
+_DOCS_FILE = "docs.pkl"
+
+# LRU of opened indexes, keyed by ingestion_id, holding at most DENSE_INDEX_CACHE_SIZE.
+# Missing indexes are not cached so a later ingest is picked up.
+_INDEXES = OrderedDict()
+_INDEXES_LOCK = threading.Lock()
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-vector int8 quantization. Returns (int8 codes, float32 scales)."""
+    scales = np.abs(vectors).max(axis=-1, keepdims=True) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+    return codes, scales.squeeze(-1).astype(np.float32)
+
+
+class DenseIndex:
+    """Brute-force cosine KNN over one ingestion's int8-quantized, normalized embeddings.
+
+    For a single PDF (typically <1k chunks) one (N, d) @ (d,) product is cheaper
+    than Chroma's HNSW query plus SQLite round trips. int8 codes are a quarter of
+    the float32 size, so scoring reads 4x less memory.
+    """
+
+    def __init__(self, embeddings: np.ndarray, scales: np.ndarray, texts: List[str], metadatas: List[Dict]):
+        self.embeddings = embeddings
+        self.scales = scales
+        self.texts = texts
+        self.metadatas = metadatas
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def search(self, query_embedding: List[float], k: int) -> Tuple[List[str], List[Dict]]:
+        """Return the k most similar chunks, best first."""
+        query, _ = quantize_int8(np.asarray(query_embedding, dtype=np.float32))
+        # Integer dot products accumulate in int32; the query's scale is shared
+        # by every row so it doesn't change the ranking
+        scores = np.einsum("nd,d->n", self.embeddings, query, dtype=np.int32) * self.scales
+
+        if k < len(scores):
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [self.texts[i] for i in top], [self.metadatas[i] for i in top]
+
+
+def _index_dir(ingestion_id: str) -> str:
+    return os.path.join(DENSE_INDEX_DIR, ingestion_id)
+
+
+def save_dense_index(ingestion_id: str, embeddings: List[List[float]], texts: List[str], metadatas: List[Dict]):
+    """Persist int8-quantized normalized embeddings and chunk payloads for small ingestions."""
+    if len(texts) >= DENSE_INDEX_MAX_VECTORS:
+        logger.info(f"Skipping dense index: {len(texts)} chunks >= {DENSE_INDEX_MAX_VECTORS}")
+        return
+
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms == 0, 1.0, norms)
+    codes, scales = quantize_int8(matrix)
+
+    index_dir = _index_dir(ingestion_id)
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, _DOCS_FILE), "wb") as f:
+        pickle.dump({"texts": texts, "metadatas": metadatas}, f)
+    np.save(os.path.join(index_dir, _SCALES_FILE), scales)
+    # Embeddings are written last; their presence marks the index as complete
+    np.save(os.path.join(index_dir, _EMBEDDINGS_FILE), codes)
+    logger.info(f"Saved dense index for {ingestion_id} ({len(texts)} vectors)")
+
+
+def load_dense_index(ingestion_id: str) -> Optional[DenseIndex]:
+    """Open the dense index for an ingestion, or return None if none was saved."""
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(ingestion_id)
+        if index is not None:
+            _INDEXES.move_to_end(ingestion_id)
+            return index
+
+    index_dir = _index_dir(ingestion_id)
+    embeddings_path = os.path.join(index_dir, _EMBEDDINGS_FILE)
+    if not os.path.exists(embeddings_path):
+        return None
+
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(ingestion_id)
+        if index is None:
+            try:
+                with open(os.path.join(index_dir, _DOCS_FILE), "rb") as f:
+                    docs = pickle.load(f)
+                embeddings = np.load(embeddings_path, mmap_mode="r")
+                scales = np.load(os.path.join(index_dir, _SCALES_FILE))
+                index = DenseIndex(embeddings, scales, docs["texts"], docs["metadatas"])
+            except Exception as e:
+                logger.error(f"Failed to load dense index {index_dir} ({e}), using ChromaDB")
+                return None
+            _INDEXES[ingestion_id] = index
+            if len(_INDEXES) > DENSE_INDEX_CACHE_SIZE:
+                _INDEXES.popitem(last=False)
+    return index
@@ -0,0 +1,46 @@
+import sqlite3
+import logging
+from contextlib import closing
+from typing import Optional, Tuple
+
+import blake3
+
+from config import INGEST_REGISTRY_PATH
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingestions (
+    digest TEXT PRIMARY KEY,
+    ingestion_id TEXT NOT NULL,
+    response TEXT NOT NULL
+)
+"""
+
+
+def pdf_digest(content: bytes) -> str:
+    """BLAKE3 hex digest of the uploaded PDF bytes."""
+    return blake3.blake3(content, max_threads=blake3.blake3.AUTO).hexdigest()
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(INGEST_REGISTRY_PATH)
+    conn.execute(_SCHEMA)
+    return conn
+
+
+def lookup_ingestion(digest: str) -> Optional[Tuple[str, str]]:
+    """Return (ingestion_id, serialized IngestResponse) for a previously ingested PDF, or None."""
+    with closing(_connect()) as conn:
+        return conn.execute(
+            "SELECT ingestion_id, response FROM ingestions WHERE digest = ?", (digest,)
+        ).fetchone()
+
+
+def register_ingestion(digest: str, ingestion_id: str, response_json: str):
+    """Record a completed ingestion so identical uploads can reuse it."""
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO ingestions (digest, ingestion_id, response) VALUES (?, ?, ?)",
+            (digest, ingestion_id, response_json),
+        )
@@ -0,0 +1,28 @@
+import re
+import logging
+
+import msgspec
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Leading ```/```json fence or trailing ``` fence around an LLM JSON payload
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def parse_llm_json(response, schema=None) -> any:
+    """Extract and parse JSON from an LLM response, stripping markdown wrappers.
+
+    With a msgspec schema (e.g. List[EvalResult]) the payload is decoded and
+    validated in one pass, then returned as plain dicts/lists. Use a Union to
+    accept several shapes (e.g. a bare list or a wrapping object) without a
+    second parse. Payloads that don't match the schema fall back to untyped
+    parsing.
+    """
+    content = _FENCE_RE.sub("", response.content.strip())
+    if schema is not None:
+        try:
+            return msgspec.to_builtins(msgspec.json.decode(content, type=schema))
+        except msgspec.ValidationError as e:
+            logger.warning(f"LLM JSON did not match {schema} ({e}), parsing untyped")
+    return orjson.loads(content)
@@ -1,29 +1,97 @@
 import os
+import queue
+import atexit
 import logging
+import logging.handlers
+import threading
 from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
 
 from config import LOG_DIR
 
+# Set for the duration of request_logger; asyncio tasks and to_thread calls inherit it
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+_FORMATTER = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+_OPEN, _CLOSE = "open", "close"
+
+# Lazy-started listener that owns all per-request log files
+_LISTENER = None
+_LISTENER_LOCK = threading.Lock()
+
+
+class _RequestContextFilter(logging.Filter):
+    """Tag records with the current request_id; records logged outside a request are not queued."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return record.request_id is not None
+
+
+class _RequestFileRouter(logging.Handler):
+    """Writes each queued record to its request's log file, on the QueueListener thread."""
+
+    def __init__(self):
+        super().__init__()
+        self.files = {}
+
+    def emit(self, record: logging.LogRecord):
+        request_id = record.request_id
+        control = getattr(record, "request_log_control", None)
+        if control == _OPEN:
+            handler = logging.FileHandler(os.path.join(LOG_DIR, f"{request_id}.log"))
+            handler.setFormatter(_FORMATTER)
+            self.files[request_id] = handler
+        elif control == _CLOSE:
+            handler = self.files.pop(request_id, None)
+            if handler is not None:
+                handler.close()
+        elif request_id in self.files:
+            self.files[request_id].handle(record)
+
+
+def _get_listener() -> logging.handlers.QueueListener:
+    """Install one QueueHandler on the root logger, feeding a background QueueListener."""
+    global _LISTENER
+    if _LISTENER is None:
+        with _LISTENER_LOCK:
+            if _LISTENER is None:
+                log_queue = queue.SimpleQueue()
+                queue_handler = logging.handlers.QueueHandler(log_queue)
+                queue_handler.setLevel(logging.INFO)
+                queue_handler.addFilter(_RequestContextFilter())
+
+                listener = logging.handlers.QueueListener(log_queue, _RequestFileRouter())
+                listener.start()
+                atexit.register(listener.stop)
+                logging.getLogger().addHandler(queue_handler)
+                _LISTENER = listener
+    return _LISTENER
+
+
+def _control_record(request_id: str, control: str) -> logging.LogRecord:
+    return logging.makeLogRecord({"request_id": request_id, "request_log_control": control})
+
 
 @contextmanager
 def request_logger(request_id: str):
-    """Context manager that attaches a file handler to the root logger for the request duration.
+    """Context manager that routes logs from the current context to logs/{request_id}.log.
 
     All log statements (from main.py, generator, evaluation, retrieval, etc.)
-    are captured into logs/{request_id}.log while inside this context.
+    made while inside this context, including from tasks and worker threads it
+    starts, are captured. File I/O happens on the listener thread, and
+    concurrent requests never write into each other's files.
     """
+    listener = _get_listener()
     os.makedirs(LOG_DIR, exist_ok=True)
     log_path = os.path.join(LOG_DIR, f"{request_id}.log")
 
-    handler = logging.FileHandler(log_path)
-    handler.setLevel(logging.INFO)
-    handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
-
-    root_logger = logging.getLogger()
-    root_logger.addHandler(handler)
+    # Queued ahead of this request's records, so the file is open before they arrive
+    listener.queue.put_nowait(_control_record(request_id, _OPEN))
+    token = request_id_var.set(request_id)
     try:
         yield log_path
     finally:
-        handler.flush()
-        handler.close()
-        root_logger.removeHandler(handler)
+        request_id_var.reset(token)
+        listener.queue.put_nowait(_control_record(request_id, _CLOSE))
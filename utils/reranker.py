@@ -0,0 +1,59 @@
+import os
+import logging
+from typing import List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_QUANTIZED_FILE = "model_quantized.onnx"
+
+
+class OnnxCrossEncoder:
+    """int8-quantized ONNX Runtime version of a sentence-transformers CrossEncoder.
+
+    The model is exported and dynamically quantized on first use, then loaded
+    from cache_dir afterwards. predict() mirrors CrossEncoder.predict for
+    single-logit rerankers (sigmoid scores), so callers can use either.
+    """
+
+    def __init__(self, model_name: str, cache_dir: str, max_length: int = 512):
+        from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        from transformers import AutoTokenizer
+
+        if not os.path.exists(os.path.join(cache_dir, _QUANTIZED_FILE)):
+            logger.info(f"Exporting {model_name} to ONNX with int8 dynamic quantization in {cache_dir}")
+            model = ORTModelForSequenceClassification.from_pretrained(model_name, export=True)
+            quantizer = ORTQuantizer.from_pretrained(model)
+            quantization_config = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+            quantizer.quantize(save_dir=cache_dir, quantization_config=quantization_config)
+            AutoTokenizer.from_pretrained(model_name).save_pretrained(cache_dir)
+
+        self.model = ORTModelForSequenceClassification.from_pretrained(
+            cache_dir,
+            file_name=_QUANTIZED_FILE,
+            provider="CPUExecutionProvider",
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(cache_dir)
+        self.max_length = max_length
+
+    def predict(self, pairs: List[Tuple[str, str]], batch_size: int = 32, show_progress_bar: bool = False) -> np.ndarray:
+        """Score pairs with one ONNX Runtime session call per batch_size pairs."""
+        if not pairs:
+            return np.array([], dtype=np.float32)
+
+        scores = []
+        for i in range(0, len(pairs), batch_size):
+            queries, docs = zip(*pairs[i:i + batch_size])
+            features = self.tokenizer(
+                list(queries),
+                list(docs),
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            logits = self.model(**features).logits
+            scores.append(1.0 / (1.0 + np.exp(-logits[:, 0])))
+        return np.concatenate(scores)
@@ -1,38 +1,252 @@
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
 from typing import Dict, List, Tuple
 
 import chromadb
+import numpy as np
 
 from config import (
     CHROMA_DB_PATH,
     DEFAULT_TOP_K,
     GEMINI_EMBEDDING_MODEL,
+    GEMINI_HTTP_TIMEOUT_MS,
     GOOGLE_API_KEY,
+    EMBED_CACHE,
+    QUERY_EMBEDDING_CACHE_SIZE,
+    RERANK_SCORE_CACHE_SIZE,
+    RERANKER_BATCH_SIZE,
 )
 
+from utils.dense_index import load_dense_index
+
 logger = logging.getLogger(__name__)
 
-# Lazy-loaded cross-encoder singleton
+# Lazy-loaded singletons, shared across requests. Each lock guards first construction.
 _CROSS_ENCODER = None
+_CHROMA_CLIENT = None
+_EMBEDDINGS_MODEL = None
+_GENAI_CLIENT = None
+_CROSS_ENCODER_LOCK = threading.Lock()
+_CHROMA_CLIENT_LOCK = threading.Lock()
+_EMBEDDINGS_MODEL_LOCK = threading.Lock()
+_GENAI_CLIENT_LOCK = threading.Lock()
+
+
+def _cpu_supports_bf16() -> bool:
+    """True when the CPU has native BF16 matmuls (AVX512_BF16 or AMX-BF16).
+
+    Plain AVX-512 is not enough: without these extensions BF16 is emulated and
+    slower than FP32.
+    """
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    flags = set(line.split(":", 1)[1].split())
+                    return bool(flags & {"avx512_bf16", "amx_bf16"})
+    except OSError:
+        pass
+    return False
+
+
+def _reduce_precision(cross_encoder):
+    """Run the PyTorch reranker in FP16 on GPU, BF16 on CPUs with native BF16, else FP32."""
+    import torch
+    if torch.cuda.is_available():
+        cross_encoder.model.half()
+        logger.info("Cross-encoder running in FP16 on GPU")
+    elif _cpu_supports_bf16():
+        cross_encoder.model.to(torch.bfloat16)
+        logger.info("Cross-encoder running in BF16 on CPU")
 
 
 def get_cross_encoder():
     global _CROSS_ENCODER
     if _CROSS_ENCODER is None:
-        from sentence_transformers import CrossEncoder
-        from config import RERANKER_MODEL
-        logger.info(f"Loading cross-encoder model: {RERANKER_MODEL}")
-        _CROSS_ENCODER = CrossEncoder(RERANKER_MODEL)
+        with _CROSS_ENCODER_LOCK:
+            if _CROSS_ENCODER is None:
+                from config import RERANKER_MODEL, RERANKER_BACKEND, RERANKER_ONNX_DIR
+                if RERANKER_BACKEND == "onnx":
+                    try:
+                        from utils.reranker import OnnxCrossEncoder
+                        logger.info(f"Loading int8 ONNX cross-encoder: {RERANKER_MODEL}")
+                        _CROSS_ENCODER = OnnxCrossEncoder(RERANKER_MODEL, RERANKER_ONNX_DIR)
+                    except Exception as e:
+                        logger.error(f"ONNX reranker unavailable ({e}), falling back to PyTorch")
+                if _CROSS_ENCODER is None:
+                    from sentence_transformers import CrossEncoder
+                    logger.info(f"Loading cross-encoder model: {RERANKER_MODEL}")
+                    _CROSS_ENCODER = CrossEncoder(RERANKER_MODEL)
+                    _reduce_precision(_CROSS_ENCODER)
     return _CROSS_ENCODER
 
 
+def get_chroma_client():
+    """Return the process-wide ChromaDB client."""
+    global _CHROMA_CLIENT
+    if _CHROMA_CLIENT is None:
+        with _CHROMA_CLIENT_LOCK:
+            if _CHROMA_CLIENT is None:
+                _CHROMA_CLIENT = chromadb.PersistentClient(path=CHROMA_DB_PATH)
+    return _CHROMA_CLIENT
+
+
+def get_genai_client():
+    """Return the process-wide google-genai client, so every call reuses its HTTP connection pool."""
+    global _GENAI_CLIENT
+    if _GENAI_CLIENT is None:
+        with _GENAI_CLIENT_LOCK:
+            if _GENAI_CLIENT is None:
+                from google import genai
+                _GENAI_CLIENT = genai.Client(
+                    api_key=GOOGLE_API_KEY,
+                    http_options={"timeout": GEMINI_HTTP_TIMEOUT_MS},
+                )
+    return _GENAI_CLIENT
+
+
+class GeminiEmbeddings:
+    """Gemini embeddings over the shared google-genai client.
+
+    Same interface and task types as LangChain's GoogleGenerativeAIEmbeddings,
+    without its per-call wrapping.
+    """
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], "RETRIEVAL_QUERY")[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, "RETRIEVAL_DOCUMENT")
+
+    @staticmethod
+    def _embed(texts: List[str], task_type: str) -> List[List[float]]:
+        from google.genai import types
+        result = get_genai_client().models.embed_content(
+            model=GEMINI_EMBEDDING_MODEL,
+            contents=texts,
+            config=types.EmbedContentConfig(task_type=task_type),
+        )
+        return [list(embedding.values) for embedding in result.embeddings]
+
+
 def get_embeddings_model():
-    """Return Gemini embeddings model via LangChain."""
-    from langchain_google_genai import GoogleGenerativeAIEmbeddings
-    return GoogleGenerativeAIEmbeddings(
-        model=GEMINI_EMBEDDING_MODEL,
-        google_api_key=GOOGLE_API_KEY,
-    )
+    """Return the Gemini embeddings model (built once per process)."""
+    global _EMBEDDINGS_MODEL
+    if _EMBEDDINGS_MODEL is None:
+        with _EMBEDDINGS_MODEL_LOCK:
+            if _EMBEDDINGS_MODEL is None:
+                get_genai_client()
+                _EMBEDDINGS_MODEL = GeminiEmbeddings()
+    return _EMBEDDINGS_MODEL
+
+
+class _LRUCache:
+    """Thread-safe LRU map, keyed by SHA-256 digests so long texts aren't held as keys."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+_QUERY_EMBEDDING_CACHE = _LRUCache(QUERY_EMBEDDING_CACHE_SIZE)
+_RERANK_SCORE_CACHE = _LRUCache(RERANK_SCORE_CACHE_SIZE)
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def embed_query(query: str) -> List[float]:
+    """Embed a search query, reusing cached vectors for repeated queries."""
+    if not EMBED_CACHE:
+        return get_embeddings_model().embed_query(query)
+
+    key = _sha256(query)
+    embedding = _QUERY_EMBEDDING_CACHE.get(key)
+    if embedding is None:
+        embedding = tuple(get_embeddings_model().embed_query(query))
+        _QUERY_EMBEDDING_CACHE.put(key, embedding)
+    else:
+        logger.info("Query embedding cache hit")
+    return list(embedding)
+
+
+def _predict(pairs: List[Tuple[str, str]]):
+    """Score all pairs with the reranker in a single batch, without autograd bookkeeping."""
+    import torch
+    with torch.inference_mode():
+        return get_cross_encoder().predict(pairs, batch_size=RERANKER_BATCH_SIZE, show_progress_bar=False)
+
+
+def rerank_scores(query: str, documents: List[str]) -> List[float]:
+    """Cross-encoder scores for (query, doc) pairs; only uncached pairs are run through the model."""
+    if not EMBED_CACHE:
+        return [float(s) for s in _predict([(query, doc) for doc in documents])]
+
+    query_key = _sha256(query)
+    keys = [(query_key, _sha256(doc)) for doc in documents]
+    scores = [_RERANK_SCORE_CACHE.get(key) for key in keys]
+    missing = [i for i, score in enumerate(scores) if score is None]
+
+    if missing:
+        predicted = _predict([(query, documents[i]) for i in missing])
+        for i, score in zip(missing, predicted):
+            scores[i] = float(score)
+            _RERANK_SCORE_CACHE.put(keys[i], scores[i])
+    logger.info(f"Reranker scored {len(missing)} pairs ({len(documents) - len(missing)} cached)")
+    return scores
+
+
+def get_collection(ingestion_id: str):
+    """Open the ChromaDB collection for an ingestion, or return None if it doesn't exist."""
+    try:
+        return get_chroma_client().get_collection(name=f"ingestion_{ingestion_id}", embedding_function=None)
+    except Exception as e:
+        logger.error(f"Collection not found: {e}")
+        return None
+
+
+# Chunk count per collection; collections are never modified after ingest
+_COLLECTION_COUNTS = {}
+
+
+def _collection_count(collection) -> int:
+    count = _COLLECTION_COUNTS.get(collection.name)
+    if count is None:
+        count = collection.count()
+        _COLLECTION_COUNTS[collection.name] = count
+    return count
+
+
+def _rank_whole_collection(collection, query_embedding: List[float]) -> Tuple[List[str], List[Dict]]:
+    """Fetch every chunk and rank by cosine similarity in NumPy, skipping the HNSW search."""
+    results = collection.get(include=["documents", "metadatas", "embeddings"])
+    if not results["documents"]:
+        return [], []
+
+    embeddings = np.asarray(results["embeddings"], dtype=np.float32)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1) * (np.linalg.norm(query) or 1.0)
+    scores = (embeddings @ query) / np.where(norms == 0, 1.0, norms)
+    order = np.argsort(-scores)
+    return [results["documents"][i] for i in order], [results["metadatas"][i] for i in order]
 
 
 def retrieve_context(
@@ -40,42 +254,53 @@ def retrieve_context(
     query: str,
     topic: str = None,
     top_k: int = DEFAULT_TOP_K,
+    collection=None,
 ) -> Tuple[List[str], List[Dict]]:
     """
     3-stage retrieval funnel:
-    1. Dense retrieval (fetch top_k * 5 candidates)
+    1. Dense retrieval (fetch top_k * 5 candidates, in-memory for small ingestions)
     2. Coarse filtering (by section title if topic specified, with fail-safe)
     3. Cross-encoder reranking
+
+    Pass a collection already opened via get_collection to skip reopening it.
     """
     logger.info(f"Retrieval start: ingestion_id={ingestion_id}, topic='{topic}', top_k={top_k}")
 
-    embeddings_model = get_embeddings_model()
-    search_query = topic if topic else query
-    query_embedding = embeddings_model.embed_query(search_query)
+    # Small ingestions are searched in-process; ChromaDB serves the rest
+    index = load_dense_index(ingestion_id)
+    if index is None and collection is None:
+        collection = get_collection(ingestion_id)
+        if collection is None:
+            return [], []
 
-    chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-    try:
-        collection = chroma_client.get_collection(name=f"ingestion_{ingestion_id}")
-    except Exception as e:
-        logger.error(f"Collection not found: {e}")
-        return [], []
+    search_query = topic if topic else query
+    query_embedding = embed_query(search_query)
 
     # Stage 1: Dense retrieval
     initial_k = top_k * 5
-    results = collection.query(query_embeddings=[query_embedding], n_results=initial_k)
-
-    documents = results["documents"][0] if results["documents"] else []
-    metadatas = results["metadatas"][0] if results["metadatas"] else []
-    logger.info(f"Stage 1: Retrieved {len(documents)} candidates")
+    if index is not None:
+        documents, metadatas = index.search(query_embedding, initial_k)
+        logger.info(f"Stage 1: Retrieved {len(documents)} candidates from in-memory index ({len(index)} vectors)")
+    elif initial_k >= _collection_count(collection):
+        documents, metadatas = _rank_whole_collection(collection, query_embedding)
+        logger.info(f"Stage 1: Collection holds only {len(documents)} chunks, ranked all without ANN search")
+    else:
+        results = collection.query(query_embeddings=[query_embedding], n_results=initial_k)
+        documents = results["documents"][0] if results["documents"] else []
+        metadatas = results["metadatas"][0] if results["metadatas"] else []
+        logger.info(f"Stage 1: Retrieved {len(documents)} candidates")
 
     if not documents:
         return [], []
 
     # Stage 2: Coarse filtering by topic
+    # Chroma's metadata `where` has no substring operator, so this stays in Python;
+    # section_title_lc is lowercased at ingest (older collections fall back to lower())
     if topic and metadatas:
+        topic_lc = topic.lower()
         filtered = [
             (doc, meta) for doc, meta in zip(documents, metadatas)
-            if topic.lower() in meta.get("section_title", "").lower()
+            if topic_lc in (meta.get("section_title_lc") or meta.get("section_title", "").lower())
         ]
         # Fail-safe: only apply filter if it retains enough results
         if len(filtered) >= 3:
@@ -91,9 +316,7 @@ def retrieve_context(
 
     # Stage 3: Cross-encoder reranking
     try:
-        cross_encoder = get_cross_encoder()
-        pairs = [(search_query, doc) for doc in documents]
-        scores = cross_encoder.predict(pairs)
+        scores = rerank_scores(search_query, documents)
 
         scored = sorted(zip(scores, documents, metadatas), key=lambda x: x[0], reverse=True)
         reranked_docs = [doc for _, doc, _ in scored[:top_k]]
@@ -0,0 +1,187 @@
+import os
+import re
+import copy
+import time
+import atexit
+import pickle
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Optional, Pattern, Tuple
+
+import numpy as np
+
+from config import (
+    SEMANTIC_CACHE_DIR,
+    SEMANTIC_CACHE_MODEL,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_PERSIST_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+_NUMBER_RE = re.compile(r"\d+")
+
+# Lazy-loaded sentence encoder singleton; the lock guards first construction
+_SENTENCE_ENCODER = None
+_SENTENCE_ENCODER_LOCK = threading.Lock()
+
+
+def get_sentence_encoder():
+    global _SENTENCE_ENCODER
+    if _SENTENCE_ENCODER is None:
+        with _SENTENCE_ENCODER_LOCK:
+            if _SENTENCE_ENCODER is None:
+                from sentence_transformers import SentenceTransformer
+                logger.info(f"Loading semantic cache encoder: {SEMANTIC_CACHE_MODEL}")
+                _SENTENCE_ENCODER = SentenceTransformer(SEMANTIC_CACHE_MODEL)
+    return _SENTENCE_ENCODER
+
+
+class _SemanticCache:
+    """Embedding-keyed response store persisted to {SEMANTIC_CACHE_DIR}/{name}.pkl.
+
+    Exact repeats are answered from a SHA-256 lookup; near-duplicates are matched
+    by cosine similarity over normalized embeddings. Entries only match when the
+    signature_re matches in both keys agree, so "5 MCQs" never reuses the answer
+    for "10 MCQs". Holds at most SEMANTIC_CACHE_MAX_ENTRIES entries (oldest are
+    evicted) and writes to disk at most every SEMANTIC_CACHE_PERSIST_SECONDS.
+    """
+
+    def __init__(self, name: str, signature_re: Pattern):
+        self.path = os.path.join(SEMANTIC_CACHE_DIR, f"{name}.pkl")
+        self.signature_re = signature_re
+        self.lock = threading.Lock()
+        self.persist_lock = threading.Lock()
+        self.exact = OrderedDict()
+        self.embeddings = None
+        self.signatures = []
+        self.values = []
+        self.dirty = False
+        self.last_persist = time.monotonic()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "rb") as f:
+                    state = pickle.load(f)
+                self.exact = OrderedDict(state["exact"])
+                self.embeddings = state["embeddings"]
+                self.signatures = state["signatures"]
+                self.values = state["values"]
+                logger.info(f"Loaded semantic cache {name} ({len(self.exact)} entries)")
+            except Exception as e:
+                logger.error(f"Failed to load semantic cache {self.path} ({e}), starting empty")
+        atexit.register(self.persist)
+
+    @staticmethod
+    def _digest(key: str) -> str:
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _embed(key: str) -> np.ndarray:
+        return get_sentence_encoder().encode([key], normalize_embeddings=True).astype(np.float32)[0]
+
+    def _signature(self, key: str) -> Tuple[str, ...]:
+        return tuple(match.lower() for match in self.signature_re.findall(key))
+
+    def lookup(self, key: str, threshold: float) -> Tuple[Optional[Any], Optional[np.ndarray]]:
+        """Return (cached value or None, key embedding). The embedding is reused by store()."""
+        with self.lock:
+            value = self.exact.get(self._digest(key))
+        if value is not None or threshold >= 1.0:
+            return value, None
+
+        # Encoding is the slow part, so it runs outside the lock
+        embedding = self._embed(key)
+        signature = self._signature(key)
+        with self.lock:
+            if self.embeddings is not None:
+                scores = self.embeddings @ embedding
+                for idx in np.argsort(-scores):
+                    if scores[idx] < threshold:
+                        break
+                    if self.signatures[idx] == signature:
+                        logger.info(f"Semantic cache hit (cosine={scores[idx]:.3f})")
+                        return self.values[idx], embedding
+        return None, embedding
+
+    def store(self, key: str, value: Any, embedding: Optional[np.ndarray]):
+        with self.lock:
+            self.exact[self._digest(key)] = value
+            if len(self.exact) > SEMANTIC_CACHE_MAX_ENTRIES:
+                self.exact.popitem(last=False)
+            if embedding is not None:
+                row = embedding[np.newaxis, :]
+                self.embeddings = row if self.embeddings is None else np.vstack([self.embeddings, row])
+                self.signatures.append(self._signature(key))
+                self.values.append(value)
+                if len(self.values) > SEMANTIC_CACHE_MAX_ENTRIES:
+                    self.embeddings = self.embeddings[1:]
+                    del self.signatures[0], self.values[0]
+            self.dirty = True
+            persist_due = time.monotonic() - self.last_persist >= SEMANTIC_CACHE_PERSIST_SECONDS
+        if persist_due:
+            self.persist()
+
+    def persist(self):
+        """Snapshot under the lock, write outside it; skipped when nothing changed."""
+        with self.persist_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                state = {
+                    "exact": dict(self.exact),
+                    "embeddings": self.embeddings,
+                    "signatures": list(self.signatures),
+                    "values": list(self.values),
+                }
+                self.dirty = False
+                self.last_persist = time.monotonic()
+
+            os.makedirs(SEMANTIC_CACHE_DIR, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(state, f)
+            os.replace(tmp_path, self.path)
+
+
+def semantic_cache(
+    name: str,
+    threshold: float = SEMANTIC_CACHE_THRESHOLD,
+    enabled: bool = True,
+    signature_re: Pattern = _NUMBER_RE,
+) -> Callable:
+    """Cache a deterministic (temperature 0) LLM call keyed on its first string argument.
+
+    The wrapped function should return the parsed response; exceptions are not cached.
+    Use threshold=1.0 for exact-match-only caching. Near-duplicate keys only share an
+    entry when every signature_re match (numbers by default) agrees, case-insensitively.
+    Cache failures (e.g. the encoder can't load) are logged and the call goes through.
+    """
+    def decorator(fn: Callable) -> Callable:
+        if not enabled:
+            return fn
+        cache = _SemanticCache(name, signature_re)
+
+        @wraps(fn)
+        def wrapper(key: str, *args, **kwargs):
+            try:
+                cached, embedding = cache.lookup(key, threshold)
+            except Exception as e:
+                logger.error(f"Semantic cache {name} lookup failed ({e}), calling through")
+                cached, embedding = None, None
+            if cached is not None:
+                logger.info(f"Semantic cache hit for {name}, skipping LLM call")
+                return copy.deepcopy(cached)
+            value = fn(key, *args, **kwargs)
+            try:
+                cache.store(key, copy.deepcopy(value), embedding)
+            except Exception as e:
+                logger.error(f"Semantic cache {name} store failed ({e})")
+            return value
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,43 @@
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from config import TOKENIZER_ENCODING
+
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    """Return the shared tiktoken encoding (loaded once per process)."""
+    import tiktoken
+    return tiktoken.get_encoding(TOKENIZER_ENCODING)
+
+
+def encode(text: str) -> List[int]:
+    return get_encoding().encode(text, disallowed_special=())
+
+
+def decode(token_ids: List[int]) -> str:
+    return get_encoding().decode(token_ids)
+
+
+def token_offsets(token_ids: List[int]) -> List[int]:
+    """Character offset in the decoded text where each token starts.
+
+    A token that begins inside a multi-token character maps to that character's
+    start, so slicing text at these offsets never splits a character.
+    """
+    return get_encoding().decode_with_offsets(token_ids)[1]
+
+
+def truncate_tokens(text: str, max_tokens: int, token_ids: Optional[List[int]] = None) -> Tuple[str, int]:
+    """Cut text to at most max_tokens tokens on a character boundary. Returns (text, original token count).
+
+    Pass token_ids when text was already encoded to skip re-tokenizing it.
+    """
+    if token_ids is None:
+        token_ids = encode(text)
+    if len(token_ids) <= max_tokens:
+        return text, len(token_ids)
+    # Start of the first dropped token, moved back to its character's start if it
+    # begins mid-character. Offsets come from the full ids, which decode cleanly.
+    cut = token_offsets(token_ids)[max_tokens]
+    return text[:cut], len(token_ids)